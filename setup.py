@@ -14,6 +14,7 @@ setuptools.setup(
    author_email='tung@caltech.com',
    url="https://github.com/tungminhphan/traffic-intersection",
    packages=setuptools.find_packages(),
-   install_requires=['graphviz', 'imageio', 'scipy', 'numpy', 'matplotlib', 'Pillow'], #external packages as dependencies
+   install_requires=['graphviz', 'imageio>=2.5', 'imageio-ffmpeg', 'scipy', 'numpy>=1.17', 'matplotlib>=3.1', 'Pillow'], #external packages as dependencies
+   python_requires='>=3.7', # asyncio.get_running_loop and asyncio.all_tasks in rendering/broadcast.py
    include_package_data=True # set this to True in include non .py files like .png
 )
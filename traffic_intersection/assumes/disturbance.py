@@ -5,8 +5,11 @@
 import numpy as np
 
 
-def get_disturbance():
+def get_disturbance(rng=None):
     '''
-    Returns random disturbance
+    Returns random disturbance, drawn from the numpy random generator rng if given and from the global numpy random
+    state otherwise
     '''
-    return np.array([[8*(2*np.random.rand())], [0.065*(2*np.random.rand()-1)]]) # a random constant disturbance for our primitives
+    if rng is None:
+        rng = np.random
+    return np.array([[8*(2*rng.random())], [0.065*(2*rng.random()-1)]]) # a random constant disturbance for our primitives
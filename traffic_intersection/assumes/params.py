@@ -6,3 +6,5 @@ center_to_axle_dist = length/2. - axle_to_back
 front_to_axle = length-axle_to_back
 pedestrian_scale_factor = 0.32
 car_scale_factor = 0.1 # scale for when L = 50?
+# region where cars and pedestrians can conflict (x_min, y_min, x_max, y_max), bounded by the crosswalk waiting spots
+conflict_zone = (355, 170, 705, 590)
@@ -0,0 +1 @@
+# required for importing files from this folder
@@ -0,0 +1,73 @@
+# Benchmark Helpers
+
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+
+
+def measure(function, args_list, warmup=3):
+    '''
+    calls function once for every tuple of arguments in args_list and records the latency of each call
+    input:  function - the function to benchmark
+            args_list - list of argument tuples, one per call
+            warmup - number of untimed calls made before measuring
+    output: dictionary of latency statistics (in microseconds) and peak traced memory (in bytes)
+    '''
+    for args in args_list[:warmup]:
+        function(*args)
+    latencies = np.zeros(len(args_list))
+    for k, args in enumerate(args_list):
+        start = time.perf_counter()
+        function(*args)
+        latencies[k] = time.perf_counter() - start
+    # memory is traced in a separate pass since tracemalloc slows down every allocation
+    tracemalloc.start()
+    for args in args_list[:max(1, len(args_list) // 10)]:
+        function(*args)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies *= 1e6
+    return {'calls': len(args_list),
+            'mean_us': float(np.mean(latencies)),
+            'p50_us': float(np.percentile(latencies, 50)),
+            'p90_us': float(np.percentile(latencies, 90)),
+            'p99_us': float(np.percentile(latencies, 99)),
+            'max_us': float(np.max(latencies)),
+            'peak_memory_bytes': int(peak_memory)}
+
+
+def get_commit():
+    '''
+    return the current git commit hash, or None outside of a git repository
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                cwd=os.path.dirname(os.path.realpath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results, file_name):
+    '''
+    write benchmark results together with machine and commit information to a JSON file
+    '''
+    report = {'commit': get_commit(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'machine': platform.machine(),
+              'results': results}
+    with open(file_name, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_results(results):
+    for name in sorted(results):
+        stats = results[name]
+        print('{:<50s} p50 {:>10.1f}us  p90 {:>10.1f}us  p99 {:>10.1f}us  peak {:>10d}B'.format(
+            name, stats['p50_us'], stats['p90_us'], stats['p99_us'], stats['peak_memory_bytes']))
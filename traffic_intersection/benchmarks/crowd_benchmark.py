@@ -0,0 +1,102 @@
+# Crowd Benchmarks
+#
+# run from the traffic_intersection folder with
+#     python -m benchmarks.crowd_benchmark --pedestrians 10 100 1000 --output crowd.json
+# compares stepping every Pedestrian on its own with stepping all of them together in a Crowd, and checks that both
+# end in the same states
+
+import argparse
+import numpy as np
+from components.crowd import Crowd
+from components.pedestrian import Pedestrian
+from components.social_force import SocialForce
+from prepare.pedestrian_routes import get_route_table
+from benchmarks.common import measure, save_results, print_results
+
+state_tolerance = 1e-9 # relative, both paths do the same arithmetic in a different order
+
+
+def random_pedestrians(num_pedestrians, route_table, rng):
+    '''
+    returns a function that makes a fresh list of the same num_pedestrians pedestrians on random routes
+    '''
+    routes = sorted(route_table.routes)
+    picks = [routes[k] for k in rng.integers(len(routes), size = num_pedestrians)]
+    def make_pedestrians():
+        return [Pedestrian(init_state = route_table.get_initial_state(origin, destination),
+                prim_queue = route_table.get_queue(origin, destination)) for origin, destination in picks]
+    return make_pedestrians
+
+
+def record_corrections(pedestrians, dt, steps):
+    '''
+    steps pedestrians with social force corrections and returns the corrections of every step, so that both paths can
+    be given the same realistic corrections
+    '''
+    social_force = SocialForce()
+    corrections = []
+    for _ in range(steps):
+        corrections.append(social_force.get_corrections([person.state for person in pedestrians]))
+        step_each(pedestrians, dt, corrections[-1])
+    return corrections
+
+
+def step_each(pedestrians, dt, corrections):
+    for k, person in enumerate(pedestrians):
+        person.prim_next(dt, None if corrections is None else corrections[k])
+
+
+def step_crowd(crowd, dt, corrections):
+    crowd.prim_next(dt, corrections)
+
+
+def check_states(name, pedestrians, crowd):
+    '''
+    raises an AssertionError unless the pedestrians stepped one by one and the crowd are in the same states
+    '''
+    states = np.array([person.state for person in pedestrians]).reshape(-1, 4)
+    gait_progress = np.array([person.gait_progress for person in pedestrians])
+    remaining = np.array([person.prim_queue.len() for person in pedestrians])
+    difference = max(np.max(np.abs(states - crowd.states[0:len(crowd)]) / np.maximum(np.abs(states), 1), initial = 0.),
+            np.max(np.abs(gait_progress - crowd.gait_progress[0:len(crowd)]), initial = 0.))
+    if difference > state_tolerance:
+        raise AssertionError('{}: crowd states differ from the pedestrian loop by {} (relative)'.format(name,
+                difference))
+    if not np.array_equal(remaining, [person.prim_queue.len() for person in crowd.members]):
+        raise AssertionError('{}: crowd members are on other primitives than the pedestrian loop'.format(name))
+    return float(difference)
+
+
+def run(pedestrian_counts, calls, dt, crossing_wait, seed):
+    route_table = get_route_table(crossing_wait = crossing_wait)
+    results = dict()
+    for num_pedestrians in pedestrian_counts:
+        rng = np.random.default_rng(seed)
+        make_pedestrians = random_pedestrians(num_pedestrians, route_table, rng)
+        corrections = record_corrections(make_pedestrians(), dt, calls)
+        for with_corrections in [False, True]:
+            name = '{} pedestrians{}'.format(num_pedestrians, ' corrected' if with_corrections else '')
+            args_list = [(dt, corrections[k] if with_corrections else None) for k in range(calls)]
+            # measure makes the same calls for both, so both end in the same states
+            pedestrians = make_pedestrians()
+            results[name + ' loop'] = measure(step_each, [(pedestrians,) + args for args in args_list])
+            crowd = Crowd()
+            for person in make_pedestrians():
+                crowd.add(person)
+            results[name + ' crowd'] = measure(step_crowd, [(crowd,) + args for args in args_list])
+            results[name + ' crowd']['max_state_difference'] = check_states(name, pedestrians, crowd)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare stepping pedestrians one by one with stepping a crowd')
+    parser.add_argument('--pedestrians', type=int, nargs='+', default=[10, 100, 1000], help='number of pedestrians')
+    parser.add_argument('--calls', type=int, default=200, help='number of timed steps per benchmark')
+    parser.add_argument('--dt', type=float, default=0.1)
+    parser.add_argument('--crossing-wait', type=float, default=2., help='seconds waited before crossing a street')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='crowd_benchmark.json', help='JSON file for the results')
+    args = parser.parse_args()
+    results = run(args.pedestrians, args.calls, args.dt, args.crossing_wait, args.seed)
+    print_results(results)
+    save_results(results, args.output)
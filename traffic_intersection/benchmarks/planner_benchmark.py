@@ -0,0 +1,158 @@
+# Planner Microbenchmarks
+#
+# run from the traffic_intersection folder with
+#     python -m benchmarks.planner_benchmark --tiles 1 4 16 --loads 0 100 1000 --output planner.json
+# and compare the JSON files of two commits to see the effect of a planner change
+
+import argparse
+import contextlib
+import random
+import numpy as np
+import components.planner as planner
+import prepare.car_waypoint_graph as car_graph
+from prepare.graph import WeightedDirectedGraph
+from benchmarks.common import measure, save_results, print_results
+
+tile_width = 1062 # size of the intersection image
+tile_height = 762
+speed = 10. # constant speed used to turn edge lengths into primitive durations
+collision_margin = 30 # primitives whose bounding boxes are closer than this collide
+connection_radius = 200 # sinks are joined to sources of neighboring tiles that are closer than this
+
+
+def segment_box(start, end, margin):
+    return (min(start[0], end[0]) - margin, min(start[1], end[1]) - margin,
+            max(start[0], end[0]) + margin, max(start[1], end[1]) + margin)
+
+
+def boxes_overlap(box1, box2):
+    return not (box1[2] < box2[0] or box2[2] < box1[0] or box1[3] < box2[1] or box2[3] < box1[1])
+
+
+def make_tiled_graph(rows, cols):
+    '''
+    builds a synthetic primitive graph by tiling the car waypoint graph rows x cols times and joining the sinks of
+    every intersection to the closest sources of its neighbors
+    output: primitive graph, edge_to_prim_id and collision_dictionary in the same format as prepare/*.npy
+    '''
+    template_edges = [(start, end) for start in car_graph.G._edges for end in car_graph.G._edges[start]]
+    template_sources = [node for node in car_graph.G._sources if node in car_graph.G._nodes]
+    template_sinks = [node for node in car_graph.G._sinks if node in car_graph.G._nodes]
+    # primitives in the same tile collide if their boxes overlap
+    template_boxes = [segment_box(start, end, collision_margin) for start, end in template_edges]
+    template_collisions = [[j for j in range(len(template_edges)) if boxes_overlap(template_boxes[i], template_boxes[j])]
+            for i in range(len(template_edges))]
+
+    def to_node(point, row, col):
+        return (speed, 0., float(point[0] + col * tile_width), float(point[1] + row * tile_height))
+
+    G = WeightedDirectedGraph()
+    edge_to_prim_id = dict()
+    collision_dictionary = dict()
+    for row in range(rows):
+        for col in range(cols):
+            offset = (row * cols + col) * len(template_edges)
+            for k, (start, end) in enumerate(template_edges):
+                from_node = to_node(start, row, col)
+                end_node = to_node(end, row, col)
+                time_weight = np.linalg.norm(np.array(end, float) - np.array(start, float)) / speed
+                G.add_edges([(from_node, end_node, time_weight)], use_euclidean_weight=False)
+                edge_to_prim_id[(from_node, end_node)] = offset + k
+                collision_dictionary[offset + k] = {offset + j for j in template_collisions[k]}
+            for source in template_sources:
+                G.add_source(to_node(source, row, col))
+            for sink in template_sinks:
+                G.add_sink(to_node(sink, row, col))
+    # connect tiles
+    prim_id = rows * cols * len(template_edges)
+    sources = list(G._sources)
+    for sink in list(G._sinks):
+        distances = [np.hypot(sink[2] - source[2], sink[3] - source[3]) for source in sources]
+        nearest = int(np.argmin(distances))
+        if distances[nearest] < connection_radius:
+            G.add_edges([(sink, sources[nearest], distances[nearest] / speed)], use_euclidean_weight=False)
+            edge_to_prim_id[(sink, sources[nearest])] = prim_id
+            collision_dictionary[prim_id] = {prim_id}
+            prim_id += 1
+    return G, edge_to_prim_id, collision_dictionary
+
+
+@contextlib.contextmanager
+def planner_data(edge_to_prim_id, collision_dictionary):
+    '''
+    temporarily replaces the primitive dictionaries of the planner with synthetic ones
+    '''
+    old_data = planner.edge_to_prim_id, planner.collision_dictionary
+    planner.edge_to_prim_id, planner.collision_dictionary = edge_to_prim_id, collision_dictionary
+    try:
+        yield
+    finally:
+        planner.edge_to_prim_id, planner.collision_dictionary = old_data
+
+
+def random_paths(G, number_of_paths, rng):
+    sources = sorted(G._sources)
+    sinks = sorted(G._sinks)
+    frozen_graph = G.freeze()
+    paths = []
+    attempts = 0
+    while len(paths) < number_of_paths and attempts < 20 * number_of_paths:
+        attempts += 1
+        _, path = planner.dijkstra(rng.choice(sources), rng.choice(sinks), frozen_graph)
+        if len(path) > 1:
+            paths.append(path)
+    return paths
+
+
+def make_reservations(G, paths, horizon, rng):
+    '''
+    returns edge time stamps for the given paths started at random times in [0, horizon]
+    '''
+    edge_time_stamps = dict()
+    for path in paths:
+        planner.time_stamp_edge(path = path, edge_time_stamps = edge_time_stamps,
+                current_time = rng.uniform(0, horizon), primitive_graph = G)
+    return edge_time_stamps
+
+
+def run(tiles, loads, calls, horizon, seed):
+    results = dict()
+    for number_of_tiles in tiles:
+        rows = int(np.floor(np.sqrt(number_of_tiles)))
+        cols = int(np.ceil(number_of_tiles / rows))
+        rng = random.Random(seed)
+        G, edge_to_prim_id, collision_dictionary = make_tiled_graph(rows, cols)
+        frozen_graph = G.freeze()
+        sources = sorted(G._sources)
+        sinks = sorted(G._sinks)
+        name = '{}x{} tiles ({} nodes)'.format(rows, cols, len(G._nodes))
+        with planner_data(edge_to_prim_id, collision_dictionary):
+            queries = [(rng.choice(sources), rng.choice(sinks)) for _ in range(calls)]
+            results[name + ' dijkstra'] = measure(planner.dijkstra, [(start, end, G) for start, end in queries])
+            results[name + ' dijkstra frozen'] = measure(planner.dijkstra, [(start, end, frozen_graph) for start, end in queries])
+            paths = random_paths(G, calls, rng)
+            results[name + ' get_scheduled_times'] = measure(planner.get_scheduled_times,
+                    [(path, rng.uniform(0, horizon), G) for path in paths])
+            for load in loads:
+                edge_time_stamps = make_reservations(G, random_paths(G, load, rng), horizon, rng)
+                results[name + ' is_safe load={}'.format(load)] = measure(planner.is_safe,
+                        [(path, rng.uniform(0, horizon), G, edge_time_stamps) for path in paths])
+                # time stamping modifies the reservations, so every call gets its own copy
+                results[name + ' time_stamp_edge load={}'.format(load)] = measure(planner.time_stamp_edge,
+                        [(path, {key: set(value) for key, value in edge_time_stamps.items()}, rng.uniform(0, horizon), G)
+                            for path in paths])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmarks for components/planner on synthetic tiled intersections')
+    parser.add_argument('--tiles', type=int, nargs='+', default=[1, 4, 16], help='number of tiled intersections')
+    parser.add_argument('--loads', type=int, nargs='+', default=[0, 100, 1000], help='number of reserved paths')
+    parser.add_argument('--calls', type=int, default=200, help='number of timed calls per benchmark')
+    parser.add_argument('--horizon', type=float, default=120., help='reservations start within [0, horizon] seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='planner_benchmark.json', help='JSON file for the results')
+    args = parser.parse_args()
+    results = run(args.tiles, args.loads, args.calls, args.horizon, args.seed)
+    print_results(results)
+    save_results(results, args.output)
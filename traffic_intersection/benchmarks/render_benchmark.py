@@ -0,0 +1,152 @@
+# Rendering Benchmarks
+#
+# run from the traffic_intersection folder with
+#     python -m benchmarks.render_benchmark --cars 10 50 200 --pedestrians 0 50 --output render.json
+# compares the PIL path (one paste per sprite) with the batched array renderer on random scenes and the array renderer
+# with the incremental renderer on scenes where only a few agents move, and checks that all of them draw the same frames
+
+import argparse
+from types import SimpleNamespace
+import numpy as np
+import rendering.sprite_atlas as sprite_atlas
+from rendering.backgrounds import Framebuffer, get_backgrounds
+from rendering.renderer import FrameRenderer, IncrementalRenderer
+from benchmarks.common import measure, save_results, print_results
+
+light_states = [('green', 'red'), ('yellow', 'red'), ('red', 'green'), ('red', 'yellow')]
+# the PIL path and the array renderer round the alpha blend differently, PIL also blends the alpha channel
+color_tolerance = 1
+
+
+def random_heading(rng, turning=0.2):
+    if rng.random() < turning:
+        return rng.uniform(-np.pi, np.pi)
+    return rng.choice([0, np.pi / 2, np.pi, -np.pi / 2])
+
+
+def random_scene(num_cars, num_pedestrians, rng, width=1062, height=762):
+    '''
+    returns a random light state and lists of car and pedestrian stand-ins, like in the simulation most agents move
+    along the four axis-aligned headings
+    '''
+    cars = []
+    for _ in range(num_cars):
+        theta = random_heading(rng)
+        state = np.array([10., theta, rng.uniform(0, width), rng.uniform(0, height)])
+        cars.append(SimpleNamespace(state = state, color = rng.choice(['blue', 'gray'])))
+    pedestrians = []
+    for _ in range(num_pedestrians):
+        state = np.array([rng.uniform(0, width), rng.uniform(0, height), random_heading(rng), rng.integers(6)])
+        pedestrians.append(SimpleNamespace(state = state, pedestrian_type = str(rng.integers(1, 5)), film_dim = (1, 6)))
+    return light_states[rng.integers(len(light_states))], cars, pedestrians
+
+
+def moving_scenes(num_cars, num_pedestrians, num_moving, calls, rng, speed=3.):
+    '''
+    returns calls consecutive frames of a random scene in which only num_moving cars and pedestrians move, like a
+    queue waiting at a red light
+    '''
+    light_state, cars, pedestrians = random_scene(num_cars, num_pedestrians, rng)
+    scenes = []
+    for _ in range(calls):
+        for car in cars[:num_moving]:
+            car.state = car.state + speed * np.array([0, 0, np.cos(car.state[1]), np.sin(car.state[1])])
+        for pedestrian in pedestrians[:num_moving]:
+            x, y, theta, gait = pedestrian.state
+            pedestrian.state = np.array([x + np.cos(theta), y + np.sin(theta), theta, (gait + 1) % 6])
+        scenes.append((light_state, [SimpleNamespace(**vars(car)) for car in cars],
+            [SimpleNamespace(**vars(pedestrian)) for pedestrian in pedestrians]))
+    return scenes
+
+
+def render_pil(framebuffer, light_state, cars, pedestrians):
+    framebuffer.select(*light_state)
+    background = framebuffer.get_writable_image()
+    for pedestrian in pedestrians:
+        sprite_atlas.draw_pedestrian(background, pedestrian)
+    for car in cars:
+        sprite_atlas.draw_car(background, car)
+    return np.asarray(background)
+
+
+def render_array(frame_renderer, light_state, cars, pedestrians):
+    return frame_renderer.render(*light_state, cars = cars, pedestrians = pedestrians)
+
+
+def check_frames(name, expected, actual, tolerance=0, colors_only=False):
+    '''
+    raises an AssertionError unless the frames differ by at most tolerance in every channel, returns the largest
+    difference
+    '''
+    if colors_only:
+        expected, actual = expected[..., 0:3], actual[..., 0:3]
+    difference = int(np.max(np.abs(expected.astype(int) - actual.astype(int))))
+    if difference > tolerance:
+        raise AssertionError('{}: frames differ by {} > {}'.format(name, difference, tolerance))
+    return difference
+
+
+def check_array(name, framebuffer, frame_renderer, scenes):
+    '''
+    checks every frame of the array renderer against the PIL path
+    '''
+    return max(check_frames(name, render_pil(framebuffer, *scene), render_array(frame_renderer, *scene),
+            color_tolerance, colors_only = True) for scene in scenes)
+
+
+def check_incremental(name, framebuffer, frame_renderer, incremental_renderer, scenes):
+    '''
+    renders the consecutive scenes with the incremental renderer and checks every frame against a full render, which
+    it must match exactly, and against the PIL path
+    '''
+    incremental_renderer.reset()
+    difference = 0
+    for scene in scenes:
+        frame = render_array(incremental_renderer, *scene)
+        check_frames(name + ' vs array', render_array(frame_renderer, *scene), frame)
+        difference = max(difference, check_frames(name + ' vs pil', render_pil(framebuffer, *scene), frame,
+                color_tolerance, colors_only = True))
+    return difference
+
+
+def run(car_counts, pedestrian_counts, moving_counts, calls, seed):
+    backgrounds = get_backgrounds()
+    framebuffer = Framebuffer(backgrounds)
+    frame_renderer = FrameRenderer(backgrounds)
+    incremental_renderer = IncrementalRenderer(backgrounds)
+    results = dict()
+    for num_cars in car_counts:
+        for num_pedestrians in pedestrian_counts:
+            rng = np.random.default_rng(seed)
+            scenes = [random_scene(num_cars, num_pedestrians, rng) for _ in range(calls)]
+            name = '{} cars {} pedestrians'.format(num_cars, num_pedestrians)
+            results[name + ' pil'] = measure(render_pil, [(framebuffer,) + scene for scene in scenes])
+            results[name + ' array'] = measure(render_array, [(frame_renderer,) + scene for scene in scenes])
+            results[name + ' array']['max_color_difference'] = check_array(name + ' array', framebuffer,
+                    frame_renderer, scenes)
+            for num_moving in moving_counts:
+                # the frames must be rendered in order, the incremental renderer repaints what changed since the last
+                scenes = moving_scenes(num_cars, num_pedestrians, num_moving, calls, rng)
+                moving_name = name + ' {} moving'.format(num_moving)
+                results[moving_name + ' array'] = measure(render_array, [(frame_renderer,) + scene for scene in scenes],
+                        warmup = 0)
+                incremental_renderer.reset()
+                results[moving_name + ' incremental'] = measure(render_array,
+                        [(incremental_renderer,) + scene for scene in scenes], warmup = 0)
+                results[moving_name + ' incremental']['max_color_difference'] = check_incremental(
+                        moving_name + ' incremental', framebuffer, frame_renderer, incremental_renderer, scenes)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the PIL and the array renderer')
+    parser.add_argument('--cars', type=int, nargs='+', default=[10, 50, 200], help='number of cars per frame')
+    parser.add_argument('--pedestrians', type=int, nargs='+', default=[0, 50], help='number of pedestrians per frame')
+    parser.add_argument('--moving', type=int, nargs='+', default=[1, 10], help='number of moving cars and pedestrians')
+    parser.add_argument('--calls', type=int, default=50, help='number of timed frames per benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='render_benchmark.json', help='JSON file for the results')
+    args = parser.parse_args()
+    results = run(args.cars, args.pedestrians, args.moving, args.calls, args.seed)
+    print_results(results)
+    save_results(results, args.output)
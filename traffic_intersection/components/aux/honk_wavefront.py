@@ -5,6 +5,7 @@
 
 import numpy as np
 speed_of_sound = 50000 # speed of sound constant for wave propagation calculation
+min_intensity = 0.01 # wavefronts below this intensity are no longer audible
 
 class HonkWavefront:
     """HonkWavefront Class
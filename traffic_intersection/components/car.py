@@ -14,20 +14,30 @@ from numpy import cos, sin, tan
 main_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 primitive_data = main_dir + '/primitives/MA3.mat'
 from prepare.queue import Queue
-from PIL import Image
 from assumes.disturbance import get_disturbance
+import components.sprite_cache as sprite_cache
 
 
-dir_path = os.path.dirname(os.path.realpath(__file__))
-blue_car_fig = dir_path + "/imglib/cars/blue_car.png"
-gray_car_fig = dir_path + "/imglib/cars/gray_car.png"
-car_figs = {
-    "blue": blue_car_fig,
-    "gray": gray_car_fig
-}
 mat = scipy.io.loadmat(primitive_data)
 
 
+def get_controller_parameters(prim, k):
+    '''
+    returns the parameters of the controller of the primitive prim on its k-th subinterval
+    '''
+    # this diagonal matrix encodes the size of input set (a constraint)
+    G_u = np.diag([175, 1.29])
+    nu = 2  # number of inputs
+    q1 = prim['K'][0, 0][k, 0].reshape((-1, 1), order='F')
+    q2 = 0.5 * (prim['x_ref'][0, 0][:, k+1] +
+                prim['x_ref'][0, 0][:, k]).reshape(-1, 1)
+    q3 = prim['u_ref'][0, 0][:, k].reshape(-1, 1)
+    q4 = prim['u_ref'][0, 0][:, k].reshape(-1, 1)
+    q5 = np.matmul(G_u, prim['alpha'][0, 0]
+                   [k*nu:(k+1)*nu]).reshape((-1, 1), order='F')
+    return np.vstack((q1, q2, q3, q4, q5))
+
+
 def saturation_filter(u, u_max, u_min):
     """ saturation_filter Helper Function
 
@@ -54,11 +64,11 @@ class KinematicCar:
                  color='blue',  # color of the car
                  # queue of primitives, each item in the queue has the form (prim_id, prim_progress) where prim_id is the primitive ID and prim_progress is the progress of the primitive)
                  prim_queue=None,
-                 fuel_level=float('inf')):  # TODO: fuel level of the car - FUTURE FEATURE)
-        if color != 'blue' and color != 'gray':
+                 fuel_level=float('inf'),  # TODO: fuel level of the car - FUTURE FEATURE)
+                 rng=None):  # numpy random generator for the disturbances, the global numpy random state is used if None
+        if color not in sprite_cache.car_figs:
             raise Exception("Color must either be blue or gray!")
         self.color = color
-        self.fig = Image.open(car_figs[color])
         self.params = (L, a_max, a_min, nu_max, nu_min, vee_max)
         self.alive_time = 0
         self.state = np.array(init_state, dtype='float')
@@ -67,6 +77,15 @@ class KinematicCar:
         self.is_honking = is_honking
         self.prim_queue = Queue() if prim_queue is None else prim_queue
         self.fuel_level = fuel_level
+        self.agent_id = None  # assigned by the simulator
+        self.rng = rng
+
+    @property
+    def fig(self):
+        '''
+        the image of the car, shared by all cars of the same color
+        '''
+        return sprite_cache.get_image('car', self.color)
 
     def state_dot(self,
                   state,
@@ -140,6 +159,63 @@ class KinematicCar:
                 self.prim_queue.pop()  # pop it
         return False
 
+    def get_time_to_primitive_end(self):
+        '''
+        returns the time until the current primitive is completed, 0 if there is no primitive left
+        '''
+        if self.extract_primitive() == False:
+            return 0
+        prim_id, prim_progress = self.extract_primitive()
+        t_end = mat['MA3'][prim_id, 0]['t_end'][0, 0][0, 0]
+        return (1 - prim_progress) * t_end
+
+    def init_extended_state(self, prim):
+        x1 = self.state.reshape((-1, 1))
+        x2 = prim['x0'][0, 0]
+        x3 = x1 - prim['x0'][0, 0]
+        x4 = np.matmul(np.linalg.inv(
+            np.diag([4, 0.02, 4, 4])), (x1-prim['x0'][0, 0]))
+        # initial state, consisting of actual state and virtual states for the controller
+        self.extended_state = (np.vstack((x1, x2, x3, x4)))[:, 0]
+
+    def prim_next_steps(self, dts):
+        """
+        advances the car like calling prim_next(dt) for every dt in dts, but the consecutive steps that use the same
+        subinterval of a primitive are integrated together: one disturbance is drawn per step as in prim_next, so the
+        random stream stays the same, and the group is integrated with their time-weighted mean. Groups never cross
+        a subinterval boundary, so the controller parameters are always the ones prim_next would use
+        Inputs:
+        dts: list of integration times
+
+        Outputs:
+        None - the states of the car will get updated
+        """
+        dts = list(dts)
+        while len(dts) > 0:
+            if len(dts) == 1 or self.extract_primitive() == False:
+                self.prim_next(dts.pop(0))
+                continue
+            prim_id, prim_progress = self.extract_primitive()
+            prim = mat['MA3'][prim_id, 0]
+            t_end = prim['t_end'][0, 0][0, 0]
+            N = prim['K'][0, 0].shape[0]
+            if prim_progress == 0:
+                self.init_extended_state(prim)
+            k = int(prim_progress * N)
+            # the steps that start on subinterval k
+            duration, dist = 0, 0
+            while len(dts) > 0 and prim_progress < 1 and int(prim_progress * N) == k:
+                dt = dts.pop(0)
+                dist = dist + dt * get_disturbance(self.rng)
+                duration += dt
+                prim_progress = prim_progress + dt / t_end
+                self.alive_time += dt
+            q = get_controller_parameters(prim, k)
+            self.extended_state = odeint(func=prim_state_dot, y0=self.extended_state, t=[
+                                         0, duration], args=(dist / duration, q))[-1, :]
+            self.state = self.extended_state[0:4]
+            self.prim_queue.replace_top((prim_id, prim_progress))
+
     def prim_next(self, dt):
         """
         updates with primitive, if no primitive available, update with next with zero inputs
@@ -161,31 +237,14 @@ class KinematicCar:
             t_end = prim['t_end'][0, 0][0, 0]  # extract duration of primitive
             # number of subintervals encoded in primitive
             N = prim['K'][0, 0].shape[0]
-            # this diagonal matrix encodes the size of input set (a constraint)
-            G_u = np.diag([175, 1.29])
-            nu = 2  # number of inputs
-            nx = 4  # number of states
 
             if prim_progress == 0:  # compute initial extended state
-                x1 = self.state.reshape((-1, 1))
-                x2 = prim['x0'][0, 0]
-                x3 = x1 - prim['x0'][0, 0]
-                x4 = np.matmul(np.linalg.inv(
-                    np.diag([4, 0.02, 4, 4])), (x1-prim['x0'][0, 0]))
-                # initial state, consisting of actual state and virtual states for the controller
-                self.extended_state = (np.vstack((x1, x2, x3, x4)))[:, 0]
+                self.init_extended_state(prim)
             k = int(prim_progress * N)  # calculate primitive waypoint
 
-            dist = get_disturbance()
-            q1 = prim['K'][0, 0][k, 0].reshape((-1, 1), order='F')
-            q2 = 0.5 * (prim['x_ref'][0, 0][:, k+1] +
-                        prim['x_ref'][0, 0][:, k]).reshape(-1, 1)
-            q3 = prim['u_ref'][0, 0][:, k].reshape(-1, 1)
-            q4 = prim['u_ref'][0, 0][:, k].reshape(-1, 1)
-            q5 = np.matmul(G_u, prim['alpha'][0, 0]
-                           [k*nu:(k+1)*nu]).reshape((-1, 1), order='F')
+            dist = get_disturbance(self.rng)
             # parameters for the controller
-            q = np.vstack((q1, q2, q3, q4, q5))
+            q = get_controller_parameters(prim, k)
             self.extended_state = odeint(func=prim_state_dot, y0=self.extended_state, t=[
                                          0, dt], args=(dist, q))[-1, :]
             self.state = self.extended_state[0:4]
@@ -0,0 +1,243 @@
+# Crowd Class
+#
+# Advances many pedestrians at once. The crowd keeps the states, gait progress and current primitive (start, finish,
+# duration and progress) of its members in arrays and applies Pedestrian.prim_next to all of them in one vectorized
+# step. The members stay Pedestrian objects: their state is a view of a row of the crowd's state array and their
+# prim_queue is a CrowdQueue that reads and writes the crowd's arrays, so the rest of the code sees no difference.
+# Only when a member finishes a primitive is the next one loaded in Python.
+
+import numpy as np
+from prepare.queue import Queue
+
+class CrowdQueue():
+    '''
+    CrowdQueue Class
+
+    Primitive queue of a crowd member with the interface of prepare.queue.Queue. The top primitive lives in the arrays
+    of the crowd, the following ones in a list.
+
+    '''
+    def __init__(self, crowd, index):
+        self.crowd = crowd
+        self.index = index
+
+    def len(self):
+        return int(self.crowd.active[self.index]) + len(self.crowd.pending[self.index])
+
+    def top(self):
+        k = self.index
+        return self.crowd.primitives[k], float(self.crowd.progress[k])
+
+    def bottom(self):
+        pending = self.crowd.pending[self.index]
+        return pending[-1] if len(pending) > 0 else self.top()
+
+    def pop(self):
+        top = self.top()
+        self.crowd.load_primitive(self.index, skip_exhausted = False)
+        return top
+
+    def replace_top(self, new_item):
+        self.crowd.set_primitive(self.index, *new_item)
+
+    def enqueue(self, element):
+        self.crowd.pending[self.index].append(element)
+        if not self.crowd.active[self.index]:
+            self.crowd.load_primitive(self.index, skip_exhausted = False)
+        self.crowd.update_target(self.index)
+
+    def insert_in_front(self, element):
+        if self.crowd.active[self.index]: # like Queue.insert_in_front, right behind the top element
+            self.crowd.pending[self.index].insert(0, element)
+            self.crowd.update_target(self.index)
+        else:
+            self.enqueue(element)
+
+    def to_queue(self):
+        '''
+        returns a prepare.queue.Queue with the same elements
+        '''
+        prim_queue = Queue()
+        if self.crowd.active[self.index]:
+            prim_queue.enqueue(self.top())
+        for element in self.crowd.pending[self.index]:
+            prim_queue.enqueue(element)
+        return prim_queue
+
+class Crowd():
+    '''
+    Crowd Class
+
+    Container of pedestrians that are advanced together. add() takes a pedestrian in (its state and primitive queue
+    are moved into the crowd), remove() lets pedestrians go with ordinary states and queues again, prim_next(dt)
+    advances all members like calling prim_next(dt) on each of them.
+
+    '''
+    def __init__(self, capacity=16):
+        self.members = []
+        self.primitives = [] # top primitive data (start, finish, t_end) of every member, None if there is none
+        self.pending = [] # primitives following the top one of every member, in queue order
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        size = len(self.members)
+        arrays = {'states': (4,), 'gait_progress': (), 'gait_length': (), 'number_of_gaits': (), 'starts': (2,),
+                  'finishes': (2,), 't_ends': (), 'progress': (), 'active': (), 'waiting': (), 'has_target': (),
+                  'targets': (2,)}
+        for name, shape in arrays.items():
+            dtype = bool if name in ['active', 'waiting', 'has_target'] else float
+            array = np.zeros((capacity,) + shape, dtype=dtype)
+            if hasattr(self, name):
+                array[0:size] = getattr(self, name)[0:size]
+            setattr(self, name, array)
+        self.capacity = capacity
+        self.attach(range(size))
+
+    def __len__(self):
+        return len(self.members)
+
+    def attach(self, indices):
+        '''
+        points the state and the queue of members to their rows, after the rows were moved
+        '''
+        for k in indices:
+            person = self.members[k]
+            person.state = self.states[k]
+            if isinstance(person.prim_queue, CrowdQueue):
+                person.prim_queue.index = k
+            else:
+                person.prim_queue = CrowdQueue(self, k)
+
+    def add(self, person):
+        if len(self.members) == self.capacity:
+            self.allocate(2 * self.capacity)
+        k = len(self.members)
+        self.states[k] = person.state
+        self.gait_progress[k] = person.gait_progress
+        self.gait_length[k] = person.gait_length
+        self.number_of_gaits[k] = person.number_of_gaits
+        pending = []
+        while person.prim_queue.len() > 0:
+            pending.append(person.prim_queue.pop())
+        self.members.append(person)
+        self.primitives.append(None)
+        self.pending.append(pending)
+        self.active[k] = False
+        self.load_primitive(k)
+        self.attach([k])
+
+    def remove(self, to_remove):
+        '''
+        removes the members where the boolean array to_remove is True and returns them as independent pedestrians
+        '''
+        to_remove = np.asarray(to_remove, dtype=bool)
+        removed = [self.members[k] for k in np.flatnonzero(to_remove)]
+        for k in np.flatnonzero(to_remove):
+            person = self.members[k]
+            person.gait_progress = float(self.gait_progress[k])
+            person.prim_queue = person.prim_queue.to_queue()
+            person.state = self.states[k].copy()
+        keep = np.flatnonzero(~to_remove)
+        size = len(keep)
+        for name in ['states', 'gait_progress', 'gait_length', 'number_of_gaits', 'starts', 'finishes', 't_ends',
+                     'progress', 'active', 'waiting', 'has_target', 'targets']:
+            array = getattr(self, name)
+            array[0:size] = array[keep]
+        self.members[:] = [self.members[k] for k in keep]
+        self.primitives[:] = [self.primitives[k] for k in keep]
+        self.pending[:] = [self.pending[k] for k in keep]
+        self.attach(range(size))
+        return removed
+
+    def set_primitive(self, k, prim_data, prim_progress):
+        '''
+        makes (prim_data, prim_progress) the top primitive of member k
+        '''
+        start, finish, t_end = prim_data
+        self.primitives[k] = prim_data
+        self.starts[k] = start
+        self.finishes[k] = finish
+        self.t_ends[k] = t_end
+        self.progress[k] = prim_progress
+        self.waiting[k] = np.array_equal(start, finish)
+        self.active[k] = True
+
+    def update_target(self, k):
+        '''
+        a waiting pedestrian faces the end of its last primitive, if it has one after the current
+        '''
+        self.has_target[k] = len(self.pending[k]) > 0
+        if self.has_target[k]:
+            (last_start, last_finish, last_t_end), _ = self.pending[k][-1]
+            self.targets[k] = last_finish
+
+    def load_primitive(self, k, skip_exhausted=True):
+        '''
+        replaces the top primitive of member k by the next one, skipping primitives that are already completed like
+        Pedestrian.extract_primitive
+        '''
+        pending = self.pending[k]
+        while len(pending) > 0:
+            prim_data, prim_progress = pending.pop(0)
+            if prim_progress < 1 or not skip_exhausted:
+                self.set_primitive(k, prim_data, prim_progress)
+                self.update_target(k)
+                return
+        self.primitives[k] = None
+        self.active[k] = False
+        self.has_target[k] = False
+
+    def get_positions(self):
+        return self.states[0:len(self.members), 0:2]
+
+    def get_time_to_primitive_end(self):
+        '''
+        returns the time until every member completes its current primitive, infinity if it has none
+        '''
+        n = len(self.members)
+        return np.where(self.active[0:n], (1 - self.progress[0:n]) * self.t_ends[0:n], np.inf)
+
+    def is_walking(self):
+        n = len(self.members)
+        return self.active[0:n] & ~self.waiting[0:n]
+
+    def prim_next(self, dt, velocity_corrections=None):
+        '''
+        advances every member by dt, exactly like Pedestrian.prim_next; velocity_corrections is an optional (n, 2)
+        array with the velocity correction of every member
+        '''
+        n = len(self.members)
+        if n == 0:
+            return
+        states, active, waiting = self.states[0:n], self.active[0:n], self.waiting[0:n]
+        progress, t_ends = self.progress[0:n], self.t_ends[0:n]
+        if velocity_corrections is None:
+            # ensure that starting position is correct at start of primitive
+            at_start = active & (progress == 0)
+            states[at_start, 0:2] = self.starts[0:n][at_start]
+        walking = active & ~waiting
+        turning = active & waiting & self.has_target[0:n]
+        states[active & waiting, 3] = 0 # reset gait
+        targets = np.where(walking[:, None], self.finishes[0:n], self.targets[0:n])
+        dx = targets[:, 0] - states[:, 0]
+        dy = targets[:, 1] - states[:, 1]
+        headings = np.arctan2(dy, dx)
+        states[:, 2] = np.where(walking | turning, headings, states[:, 2])
+        remaining_distance = np.where(walking, np.hypot(dx, dy), 0)
+        remaining_times = (1 - progress) * t_ends
+        if velocity_corrections is not None: # see Pedestrian.prim_next
+            remaining_times = np.maximum(remaining_times, dt)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            vee = np.where(active, remaining_distance / remaining_times, 0)
+        # Pedestrian.next with inputs (0, vee)
+        states[:, 0] += vee * np.cos(states[:, 2]) * dt
+        states[:, 1] += vee * np.sin(states[:, 2]) * dt
+        if velocity_corrections is not None:
+            states[active, 0:2] += np.asarray(velocity_corrections)[active] * dt
+        gait_progress = self.gait_progress[0:n] + vee * dt / self.gait_length[0:n]
+        gait_change = gait_progress // 1
+        self.gait_progress[0:n] = gait_progress % 1
+        states[:, 3] = np.floor((states[:, 3] + gait_change) % self.number_of_gaits[0:n])
+        progress[active] += dt / t_ends[active]
+        for k in np.flatnonzero(active & (progress >= 1)):
+            self.load_primitive(k)
@@ -11,6 +11,7 @@ from PIL import Image
 import scipy.integrate as integrate
 dir_path = os.path.dirname(os.path.realpath(__file__))
 from prepare.queue import Queue
+import components.sprite_cache as sprite_cache
 
 
 def generate_walking_gif():
@@ -54,8 +55,16 @@ class Pedestrian:
         if prim_queue == None:
             self.prim_queue = Queue()
         else:
-            prim_queue = prim_queue
-        self.fig = dir_path + '/imglib/pedestrians/walking' + pedestrian_type + '.png'
+            self.prim_queue = prim_queue
+        self.pedestrian_type = pedestrian_type
+        self.agent_id = None  # assigned by the simulator
+
+    @property
+    def fig(self):
+        '''
+        the film strip of the walking animation, shared by all pedestrians of the same type
+        '''
+        return sprite_cache.get_image('pedestrian', self.pedestrian_type)
 
     def next(self, inputs, dt):
         """
@@ -80,7 +89,7 @@ class Pedestrian:
         current_gait = self.state[3]
         i = current_gait % self.film_dim[1]
         j = current_gait // self.film_dim[1]
-        img = Image.open(self.fig)
+        img = self.fig
         width, height = img.size
         sub_width = width/self.film_dim[1]
         sub_height = height/self.film_dim[0]
@@ -106,14 +115,38 @@ class Pedestrian:
                 self.prim_queue.pop()  # pop it
         return False
 
-    def prim_next(self, dt):
+    def is_walking(self):
+        '''
+        returns True if the pedestrian is following a primitive that moves it, False if it is waiting or has no
+        primitive left
+        '''
+        if self.extract_primitive() == False:
+            return False
+        (start, finish, t_end), prim_progress = self.extract_primitive()
+        return start != finish
+
+    def get_time_to_primitive_end(self):
+        '''
+        returns the time until the current primitive is completed, infinity if there is no primitive left
+        '''
+        if self.extract_primitive() == False:
+            return float('inf')
+        (start, finish, t_end), prim_progress = self.extract_primitive()
+        return (1 - prim_progress) * t_end
+
+    def prim_next(self, dt, velocity_correction=None):
+        """
+        The pedestrian follows its current primitive for dt. velocity_correction is an optional (vx, vy) velocity
+        (e.g., from components.social_force) added on top of the waypoint following; with it, the pedestrian starts
+        a primitive from where it is instead of being put at the start of the primitive
+        """
         if self.extract_primitive() == False:  # if there is no primitive to use
             self.next((0, 0), dt)
         else:
             # extract primitive data and primitive progress from prim
             prim_data, prim_progress = self.extract_primitive()
             start, finish, t_end = prim_data  # extract data from primitive
-            if prim_progress == 0:  # ensure that starting position is correct at start of primitive
+            if prim_progress == 0 and velocity_correction is None:  # ensure that starting position is correct at start of primitive
                 self.state[0] = start[0]
                 self.state[1] = start[1]
             if start == finish:  # waiting mode
@@ -135,8 +168,15 @@ class Pedestrian:
                     self.state[2] = heading
                 remaining_distance = np.linalg.norm(np.array([dx, dy]))
             remaining_time = (1-prim_progress) * t_end
+            if velocity_correction is not None:
+                # a corrected pedestrian is not put back on its primitive, so a remaining time that is only a rounding
+                # error must not turn the distance pushed off the finish into a huge speed
+                remaining_time = max(remaining_time, dt)
             vee = remaining_distance / remaining_time
             self.next((0, vee), dt)
+            if velocity_correction is not None:
+                self.state[0] += velocity_correction[0] * dt
+                self.state[1] += velocity_correction[1] * dt
             prim_progress += dt / t_end
             self.prim_queue.replace_top(
                 (prim_data, prim_progress))  # update primitive queue
@@ -8,7 +8,9 @@ import sys
 sys.path.append('..')
 import time
 import random
+import heapq
 import prepare.queue as queue
+from prepare.graph import FrozenGraph
 import prepare.car_waypoint_graph as waypoint_graph
 import primitives.tubes
 import numpy as np
@@ -17,8 +19,8 @@ if __name__ == '__main__':
 else:
     visualize = False
 
-collision_dictionary = np.load('prepare/collision_dictionary.npy').item()
-edge_to_prim_id = np.load('prepare/edge_to_prim_id.npy').item()
+collision_dictionary = np.load('prepare/collision_dictionary.npy', allow_pickle = True).item()
+edge_to_prim_id = np.load('prepare/edge_to_prim_id.npy', allow_pickle = True).item()
 
 
 def dijkstra(start, end, graph):
@@ -30,6 +32,8 @@ def dijkstra(start, end, graph):
             graph - weighted directed graph
     output: shortest path from start to end node
     '''
+    if isinstance(graph, FrozenGraph):
+        return dijkstra_frozen(start, end, graph)
     if start == end:  # if start coincides with end
         return 0, [start]
     else:  # otherwise
@@ -75,6 +79,51 @@ def dijkstra(start, end, graph):
     return score[end], shortest_path
 
 
+def dijkstra_frozen(start, end, graph):
+    '''
+    same as dijkstra but for a FrozenGraph, the search runs on integer node indices with a binary heap
+    input:  start - start node
+            end - end node
+            graph - frozen weighted directed graph
+    output: shortest path from start to end node
+    '''
+    if start not in graph.node_index or end not in graph.node_index:
+        raise SyntaxError(
+            "either the start or end node is not in the graph!")
+    if start == end:
+        return 0, [start]
+    start_idx = graph.index(start)
+    end_idx = graph.index(end)
+    indptr = graph.indptr
+    indices = graph.indices
+    weights = graph.weights
+    score = {start_idx: 0}
+    predecessor = {}
+    marked = set()
+    heap = [(0, start_idx)]
+    while heap:
+        current_score, current = heapq.heappop(heap)
+        if current in marked:
+            continue
+        if current == end_idx:
+            break
+        marked.add(current)
+        row_start, row_end = indptr[current], indptr[current+1]
+        for neighbor, weight in zip(indices[row_start:row_end].tolist(), weights[row_start:row_end].tolist()):
+            new_score = current_score + weight
+            if new_score < score.get(neighbor, float('inf')):
+                score[neighbor] = new_score
+                predecessor[neighbor] = current
+                heapq.heappush(heap, (new_score, neighbor))
+    if end_idx not in score:
+        return float('inf'), []
+    shortest_path = [end_idx]
+    while shortest_path[-1] != start_idx:
+        shortest_path.append(predecessor[shortest_path[-1]])
+    shortest_path.reverse()
+    return score[end_idx], [graph.node(idx) for idx in shortest_path]
+
+
 def get_scheduled_times(path, current_time, primitive_graph):
     '''
     this function takes in a path and computes the scheduled times of arrival at the nodes on this path
@@ -85,7 +134,7 @@ def get_scheduled_times(path, current_time, primitive_graph):
     scheduled_times = [now]
     for prev, curr in zip(path[0::1], path[1::1]):
         scheduled_times.append(
-            scheduled_times[-1] + primitive_graph._weights[(prev, curr)])
+            scheduled_times[-1] + primitive_graph.get_weight(prev, curr))
     return scheduled_times
 
 
@@ -131,7 +180,7 @@ def is_safe(path, current_time, primitive_graph, edge_time_stamps):
         curr_edge = (left_node, right_node)
         curr_prim_id = edge_to_prim_id[curr_edge]
         scheduled_times.append(
-            scheduled_times[-1] + primitive_graph._weights[curr_edge])
+            scheduled_times[-1] + primitive_graph.get_weight(left_node, right_node))
         left_time = scheduled_times[-2]
         right_time = scheduled_times[-1]
         curr_interval = (left_time, right_time)  # next interval to check
@@ -0,0 +1,135 @@
+# Social Force Model
+#
+# Local interaction between pedestrians after Helbing and Molnar's social force model. Every pair of pedestrians closer
+# than cutoff pushes each other apart with a speed that decays exponentially with their distance, weighted down for
+# pedestrians behind the one that is pushed; a pedestrian also steps to its right, away from the pedestrians in front
+# of it, so that two pedestrians walking head-on along the same line pass each other. The result is added as a
+# velocity correction to the waypoint following of Pedestrian.prim_next (or Crowd.prim_next), so pedestrians step
+# around each other instead of walking through each other and still reach their waypoints. Neighbors are found with a
+# cell list over the intersection, a grid of cells of size cutoff, so only pedestrians in the same or adjacent cells
+# are compared and the cost grows with the number of pedestrians instead of its square.
+
+import numpy as np
+
+# the cell itself and half of its neighbors, the other half is covered by the cells that see this one as neighbor
+half_stencil = [(0, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+class CellList():
+    '''
+    Cell List Class
+
+    Grid of square cells of cell_size pixels over the rectangle bounds = (x_min, y_min, x_max, y_max). Points outside
+    the rectangle are put into the nearest border cell.
+
+    '''
+    def __init__(self, cell_size, bounds=(0, 0, 1062, 762)):
+        self.cell_size = cell_size
+        self.bounds = bounds
+        x_min, y_min, x_max, y_max = bounds
+        self.num_x = max(int(np.ceil((x_max - x_min) / cell_size)), 1)
+        self.num_y = max(int(np.ceil((y_max - y_min) / cell_size)), 1)
+
+    def get_cells(self, positions):
+        '''
+        returns the column and row indices of the cells of the (n, 2) positions
+        '''
+        cell_x = np.clip(np.floor((positions[:, 0] - self.bounds[0]) / self.cell_size), 0, self.num_x - 1).astype(int)
+        cell_y = np.clip(np.floor((positions[:, 1] - self.bounds[1]) / self.cell_size), 0, self.num_y - 1).astype(int)
+        return cell_x, cell_y
+
+    def get_pairs(self, positions, cutoff=None):
+        '''
+        returns the index arrays i, j (with i != j) of all pairs of the (n, 2) positions that are closer than cutoff,
+        cutoff must not be larger than the cell size, every pair is listed once
+        '''
+        if cutoff is None:
+            cutoff = self.cell_size
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        n = len(positions)
+        if n < 2:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        cell_x, cell_y = self.get_cells(positions)
+        cells = cell_y * self.num_x + cell_x
+        order = np.argsort(cells, kind = 'stable')
+        # the points of cell c are order[cell_start[c]:cell_start[c+1]]
+        cell_start = np.searchsorted(cells[order], np.arange(self.num_x * self.num_y + 1))
+        all_i, all_j = [], []
+        for offset_x, offset_y in half_stencil:
+            neighbor_x, neighbor_y = cell_x + offset_x, cell_y + offset_y
+            valid = (neighbor_x >= 0) & (neighbor_x < self.num_x) & (neighbor_y < self.num_y)
+            neighbor = np.where(valid, neighbor_y * self.num_x + neighbor_x, 0)
+            begin = cell_start[neighbor]
+            counts = np.where(valid, cell_start[neighbor + 1] - begin, 0)
+            # every point against every point of its neighbor cell
+            i = np.repeat(np.arange(n), counts)
+            ranks = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(begin, counts) + ranks]
+            if offset_x == 0 and offset_y == 0:
+                i, j = i[i < j], j[i < j]
+            all_i.append(i)
+            all_j.append(j)
+        i, j = np.concatenate(all_i), np.concatenate(all_j)
+        close = np.sum((positions[i] - positions[j])**2, axis=1) < cutoff**2
+        return i[close], j[close]
+
+class SocialForce():
+    '''
+    Social Force Class
+
+    Velocity corrections of pedestrians. Two pedestrians at distance d < cutoff push each other apart with speed
+    strength * exp((2 * radius - d) / falloff), scaled by anisotropy + (1 - anisotropy) * (1 + cos(phi)) / 2 where phi
+    is the angle between the heading of the pushed pedestrian and the direction to the other one. The pushed pedestrian
+    also steps to its right with sidestep times that speed times max(cos(phi), 0). The total correction of a
+    pedestrian is at most max_correction. Lengths are in pixels, speeds in pixels per second.
+
+    '''
+    def __init__(self, radius=9., strength=40., falloff=6., cutoff=40., anisotropy=0.5, sidestep=0.5,
+                 max_correction=30., bounds=(0, 0, 1062, 762)):
+        self.radius = radius
+        self.strength = strength
+        self.falloff = falloff
+        self.cutoff = cutoff
+        self.anisotropy = anisotropy
+        self.sidestep = sidestep
+        self.max_correction = max_correction
+        self.cell_list = CellList(cutoff, bounds)
+
+    def get_pushes(self, magnitudes, headings, directions):
+        '''
+        returns the (m, 2) velocity corrections of pedestrians with headings that are pushed with magnitudes by
+        neighbors in the (m, 2) unit directions
+        '''
+        cos_phi = np.cos(headings) * directions[:, 0] + np.sin(headings) * directions[:, 1]
+        magnitudes = magnitudes * (self.anisotropy + (1 - self.anisotropy) * (1 + cos_phi) / 2.)
+        sidesteps = self.sidestep * magnitudes * np.maximum(cos_phi, 0)
+        # away from the neighbor and to the right of the heading
+        return -magnitudes[:, None] * directions + sidesteps[:, None] * np.c_[np.sin(headings), -np.cos(headings)]
+
+    def get_corrections(self, states):
+        '''
+        returns the (n, 2) velocity corrections of the pedestrians with (n, 4) states (x, y, theta, gait)
+        '''
+        states = np.asarray(states, dtype=float).reshape(-1, 4)
+        n = len(states)
+        corrections = np.zeros((n, 2))
+        i, j = self.cell_list.get_pairs(states[:, 0:2], self.cutoff)
+        if len(i) == 0:
+            return corrections
+        separations = states[i, 0:2] - states[j, 0:2] # from j to i
+        distances = np.hypot(separations[:, 0], separations[:, 1])
+        # pedestrians on the same spot are pushed apart along the x axis
+        coincident = distances == 0
+        separations[coincident] = [1., 0.]
+        distances[coincident] = 1.
+        normals = separations / distances[:, None]
+        magnitudes = self.strength * np.exp((2 * self.radius - distances) / self.falloff)
+        push_i = self.get_pushes(magnitudes, states[i, 2], -normals)
+        push_j = self.get_pushes(magnitudes, states[j, 2], normals)
+        for axis in range(2):
+            corrections[:, axis] = np.bincount(i, push_i[:, axis], minlength = n) + \
+                    np.bincount(j, push_j[:, axis], minlength = n)
+        # limit the corrections to max_correction
+        norms = np.hypot(corrections[:, 0], corrections[:, 1])
+        too_fast = norms > self.max_correction
+        corrections[too_fast] *= (self.max_correction / norms[too_fast])[:, None]
+        return corrections
@@ -0,0 +1,57 @@
+# Sprite Cache
+
+import os
+import numpy as np
+from PIL import Image
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+car_figs = {
+    "blue": dir_path + "/imglib/cars/blue_car.png",
+    "gray": dir_path + "/imglib/cars/gray_car.png"
+}
+pedestrian_figs = {pedestrian_type: dir_path + "/imglib/pedestrians/walking" + pedestrian_type + ".png"
+        for pedestrian_type in ['1', '2', '3', '4']}
+figs = {'car': car_figs, 'pedestrian': pedestrian_figs}
+
+# process-wide caches, every image is decoded at most once per process
+_images = dict() # (kind, key) -> PIL image
+_sprites = dict() # (kind, key) -> premultiplied RGBA array
+
+def premultiply(rgba):
+    '''
+    returns a copy of the uint8 RGBA array rgba with its color channels multiplied by alpha
+    '''
+    rgba = np.asarray(rgba, dtype=np.uint16)
+    premultiplied = np.empty(rgba.shape, dtype=np.uint8)
+    premultiplied[..., 0:3] = (rgba[..., 0:3] * rgba[..., 3:4] + 127) // 255
+    premultiplied[..., 3] = rgba[..., 3]
+    return premultiplied
+
+def get_image(kind, key):
+    '''
+    returns the shared PIL image of a car ('car', color) or of a pedestrian film strip ('pedestrian', type), the
+    image must not be modified in place
+    '''
+    try:
+        return _images[(kind, key)]
+    except KeyError:
+        image = Image.open(figs[kind][key]).convert('RGBA')
+        image.load() # decode now and close the file
+        _images[(kind, key)] = image
+        return image
+
+def get_sprite(kind, key):
+    '''
+    returns the shared read-only premultiplied RGBA uint8 array of a car or pedestrian image, see get_image
+    '''
+    try:
+        return _sprites[(kind, key)]
+    except KeyError:
+        sprite = premultiply(np.asarray(get_image(kind, key)))
+        sprite.flags.writeable = False
+        _sprites[(kind, key)] = sprite
+        return sprite
+
+def clear():
+    _images.clear()
+    _sprites.clear()
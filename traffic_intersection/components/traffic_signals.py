@@ -9,19 +9,24 @@ import random
 
 
 class TrafficLights():
-    def __init__(self, yellow_max=5, green_max=25, random_start=True, horizontal_state=['red', 28]):
+    def __init__(self, yellow_max=5, green_max=25, random_start=True, horizontal_state=['red', 28], rng=None):
         '''
         @param yellow_max is the duration of yellow
         @param green_max is the duration of yellow
         @param random_start
+        @param rng is the numpy random generator used for the random start, the random module is used if None
 
         '''
         self._max_time = {'yellow': yellow_max,
                           'green': green_max, 'red': yellow_max + green_max}
         if random_start:
             colors = ['red', 'yellow', 'green']
-            random_color = random.choice(colors)
-            random_time = random.uniform(0, self._max_time[random_color])
+            if rng is None:
+                random_color = random.choice(colors)
+                random_time = random.uniform(0, self._max_time[random_color])
+            else:
+                random_color = colors[rng.integers(len(colors))]
+                random_time = rng.uniform(0, self._max_time[random_color])
             horizontal_state = [random_color, random_time]
         else:
             horizontal_state = horizontal_state
@@ -76,6 +81,12 @@ class TrafficLights():
         self._state['horizontal'] = new_horizontal_state
         self._state['vertical'] = self.get_counterpart(new_horizontal_state)
 
+    def get_time_to_change(self):
+        '''
+        returns the time until the next color change of either light
+        '''
+        return min(self._max_time[self._state[light][0]] - self._state[light][1] for light in self._state)
+
     def get_states(self, which_light, color_or_time):
         if color_or_time == 'color':
             color_or_time = 0
@@ -5,6 +5,7 @@
 import os, sys
 sys.path.append("..")
 from math import cos, sin
+import numpy as np
 from components.pedestrian import Pedestrian
 from components.car import KinematicCar
 import assumes.params as params
@@ -77,17 +78,24 @@ def no_collision_by_radius_check(x1, y1, r1, x2, y2, r2):
 #takes two objects and checks if they are colliding
 def get_bounding_box(thing):
     if type(thing) is Pedestrian:
-        x, y, theta, gait = thing.state
+        return get_state_bounding_box(thing.state, is_car = False)
+    elif type(thing) is KinematicCar:
+        return get_state_bounding_box(thing.state, is_car = True)
+    else:
+        raise TypeError('Not sure what this object is')
+
+# same as get_bounding_box but from a car state (vee, theta, x, y) or a pedestrian state (x, y, theta, gait)
+def get_state_bounding_box(state, is_car):
+    if not is_car:
+        x, y, theta, gait = state
         vertices = vertices_pedestrian(x, y)
         radius = 40 * params.pedestrian_scale_factor #the longest distance used for quick circular bounding box
-    elif type(thing) is KinematicCar:
-        vee, theta, x, y = thing.state
+    else:
+        vee, theta, x, y = state
         r = params.center_to_axle_dist * params.car_scale_factor
         x, y = x + r*cos(theta), y + r*sin(theta)
         vertices = vertices_car(x, y)
         radius = ((788 * params.car_scale_factor / 2) ** 2 + (399 * params.car_scale_factor / 2) ** 2) ** 0.5
-    else:
-        TypeError('Not sure what this object is')
 
     rotated_vertices = [rotate_vertex(x, y, theta, vertex) for vertex in vertices]
     # takes the rotated vertices and finds the leftmost bottom vertex, orders the vertices in the counter clockwise direction with the leftmost bottom being the first one in the list
@@ -95,6 +103,16 @@ def get_bounding_box(thing):
     ordered_vertices = rotated_vertices[min_index:] + rotated_vertices[:min_index]
     return ordered_vertices, x, y, radius
 
+# vectorized circles of get_state_bounding_box for (n, 4) states of cars or pedestrians, returns the (n, 2) centers and
+# the radius
+def get_bounding_circles(states, is_car):
+    states = np.asarray(states, dtype=float).reshape(-1, 4)
+    if not is_car:
+        return states[:, 0:2].copy(), 40 * params.pedestrian_scale_factor
+    r = params.center_to_axle_dist * params.car_scale_factor
+    centers = np.c_[states[:, 2] + r * np.cos(states[:, 1]), states[:, 3] + r * np.sin(states[:, 1])]
+    return centers, ((788 * params.car_scale_factor / 2) ** 2 + (399 * params.car_scale_factor / 2) ** 2) ** 0.5
+
 def nonoverlapping_polygons(polygon1_vertices, polygon2_vertices): # SAT algorithm
     #concatenate lists of the vectors of the edges/sides
     edges = vectors_of_edges(polygon1_vertices) + vectors_of_edges(polygon2_vertices)
@@ -122,3 +122,126 @@ class WeightedDirectedGraph(DirectedGraph):
         for start_node in self._edges:
             for end_node in self._edges[start_node]:
                 print(str(start_node) + ' -(' + str(self._weights[start_node, end_node]) +  ')-> ' +  str(end_node))
+
+    def get_weight(self, start, end):
+        '''
+        return the weight of the edge (start, end)
+
+        '''
+        return self._weights[(start, end)]
+
+    def freeze(self):
+        '''
+        Use this function to compile the graph into integer-indexed compressed sparse row (CSR) arrays. Nodes are
+        numbered in sorted order and the outgoing edges of node i are indices[indptr[i]:indptr[i+1]] with weights
+        weights[indptr[i]:indptr[i+1]]. Sources and sinks that have no edges are kept as isolated nodes. The returned
+        FrozenGraph does not change if this graph is modified later.
+
+        '''
+        nodes = sorted(self._nodes | self._sources | self._sinks)
+        node_index = {node: idx for idx, node in enumerate(nodes)}
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        indices = []
+        weights = []
+        for idx, node in enumerate(nodes):
+            if node in self._edges:
+                neighbors = sorted(node_index[end_node] for end_node in self._edges[node])
+                for neighbor in neighbors:
+                    indices.append(neighbor)
+                    weights.append(self._weights[(node, nodes[neighbor])])
+            indptr[idx+1] = len(indices)
+        return FrozenGraph(nodes = nodes, indptr = indptr, indices = indices, weights = weights,
+                sources = self._sources, sinks = self._sinks)
+
+class FrozenGraph():
+    '''
+    Read-only weighted directed graph in compressed sparse row form, created by WeightedDirectedGraph.freeze().
+    Search algorithms work on the integer node indices, node() and index() convert between indices and the
+    original node tuples. Only the arrays are pickled, so frozen graphs are cheap to send to worker processes.
+
+    '''
+    def __init__(self, nodes, indptr, indices, weights, sources=(), sinks=()):
+        self.nodes = [tuple(node) for node in nodes]
+        self.node_index = {node: idx for idx, node in enumerate(self.nodes)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=float)
+        self.sources = np.array(sorted(self.node_index[node] for node in sources), dtype=np.int64)
+        self.sinks = np.array(sorted(self.node_index[node] for node in sinks), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getstate__(self):
+        # nodes are stored as a single float array, the lookup dictionary is rebuilt on unpickling
+        return {'node_array': np.array(self.nodes, dtype=float), 'indptr': self.indptr, 'indices': self.indices,
+                'weights': self.weights, 'sources': self.sources, 'sinks': self.sinks}
+
+    def __setstate__(self, state):
+        self.nodes = [tuple(row) for row in state['node_array'].tolist()]
+        self.node_index = {node: idx for idx, node in enumerate(self.nodes)}
+        self.indptr = state['indptr']
+        self.indices = state['indices']
+        self.weights = state['weights']
+        self.sources = state['sources']
+        self.sinks = state['sinks']
+
+    def index(self, node):
+        '''
+        return the integer index of node
+
+        '''
+        return self.node_index[node]
+
+    def node(self, idx):
+        '''
+        return the node tuple with integer index idx
+
+        '''
+        return self.nodes[idx]
+
+    def neighbors(self, idx):
+        '''
+        return the indices of the successors of the node with index idx
+
+        '''
+        return self.indices[self.indptr[idx]:self.indptr[idx+1]]
+
+    def edge_weights(self, idx):
+        '''
+        return the weights of the outgoing edges of the node with index idx, in the same order as neighbors(idx)
+
+        '''
+        return self.weights[self.indptr[idx]:self.indptr[idx+1]]
+
+    def get_weight(self, start, end):
+        '''
+        return the weight of the edge (start, end), where start and end are node tuples
+
+        '''
+        start_idx = self.node_index[start]
+        end_idx = self.node_index[end]
+        row_start, row_end = self.indptr[start_idx], self.indptr[start_idx+1]
+        k = row_start + np.searchsorted(self.indices[row_start:row_end], end_idx)
+        if k == row_end or self.indices[k] != end_idx:
+            raise KeyError((start, end))
+        return self.weights[k]
+
+    def save(self, file_name):
+        '''
+        save the graph to an .npz file
+
+        '''
+        state = self.__getstate__()
+        np.savez(file_name, **state)
+
+    @classmethod
+    def load(cls, file_name):
+        '''
+        load a graph saved with save()
+
+        '''
+        frozen_graph = cls.__new__(cls)
+        with np.load(file_name) as data:
+            frozen_graph.__setstate__({key: data[key] for key in data.files})
+        return frozen_graph
@@ -0,0 +1,121 @@
+# Pedestrian Route Table
+#
+# Precomputes the shortest route over the pedestrian waypoint graph from every source to every sink once, with one
+# Dijkstra search per source, and stores each route as the tuple of pedestrian primitives ((start, finish, t_end), 0)
+# that walks it. Spawning a pedestrian then only copies a tuple into a fresh primitive queue, there is no search per
+# spawn.
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+from prepare.graph import FrozenGraph
+from prepare.queue import Queue
+import prepare.pedestrian_waypoint_graph as pedestrian_waypoint_graph
+
+walking_speed = 30. # pixels per second, about the pace of the pedestrians of main.py
+
+class RouteTable():
+    '''
+    Route Table Class
+
+    Primitives of the shortest routes between all sources and sinks of a pedestrian waypoint graph. Every walking
+    primitive lasts its length divided by walking_speed; with crossing_wait > 0 a pedestrian also waits crossing_wait
+    seconds before it walks along an edge of crossings (by default the crosswalks of prepare.pedestrian_waypoint_graph).
+
+    '''
+    def __init__(self, graph=None, walking_speed=walking_speed, crossing_wait=0., crossings=None):
+        if graph is None:
+            graph = pedestrian_waypoint_graph.G
+        if not isinstance(graph, FrozenGraph):
+            graph = graph.freeze()
+        if crossings is None:
+            crossings = pedestrian_waypoint_graph.crossings
+        self.graph = graph
+        self.walking_speed = walking_speed
+        self.crossing_wait = crossing_wait
+        self.crossings = set(crossings) | set((finish, start) for start, finish in crossings)
+        self.routes = dict() # (origin, destination) -> waypoints of the route
+        self.lengths = dict() # (origin, destination) -> length of the route
+        self.primitives = dict() # (origin, destination) -> primitives of the route
+        self.build()
+
+    def build(self):
+        num_nodes = len(self.graph)
+        matrix = scipy.sparse.csr_matrix((self.graph.weights, self.graph.indices, self.graph.indptr),
+                shape = (num_nodes, num_nodes))
+        distances, predecessors = scipy.sparse.csgraph.dijkstra(matrix, indices = self.graph.sources,
+                return_predecessors = True)
+        for row, source_idx in enumerate(self.graph.sources):
+            for sink_idx in self.graph.sinks:
+                if sink_idx == source_idx or np.isinf(distances[row, sink_idx]):
+                    continue
+                path = [sink_idx]
+                while path[-1] != source_idx:
+                    path.append(predecessors[row, path[-1]])
+                waypoints = tuple(self.graph.node(idx) for idx in reversed(path))
+                key = (waypoints[0], waypoints[-1])
+                self.routes[key] = waypoints
+                self.lengths[key] = float(distances[row, sink_idx])
+                self.primitives[key] = self.make_primitives(waypoints)
+
+    def make_primitives(self, waypoints):
+        '''
+        returns the primitives that walk a pedestrian along waypoints
+        '''
+        primitives = []
+        for start, finish in zip(waypoints[0:-1], waypoints[1:]):
+            if self.crossing_wait > 0 and (start, finish) in self.crossings:
+                primitives.append(((start, start, self.crossing_wait), 0))
+            t_end = float(np.hypot(finish[0] - start[0], finish[1] - start[1])) / self.walking_speed
+            primitives.append(((start, finish, t_end), 0))
+        return tuple(primitives)
+
+    def get_origins(self):
+        return sorted(set(origin for origin, destination in self.routes))
+
+    def get_destinations(self, origin):
+        '''
+        returns the sinks that can be reached from origin
+        '''
+        return sorted(destination for start, destination in self.routes if start == origin)
+
+    def get_route(self, origin, destination):
+        '''
+        returns the waypoints of the shortest route from origin to destination
+        '''
+        try:
+            return self.routes[(origin, destination)]
+        except KeyError:
+            raise KeyError('there is no route from {} to {}'.format(origin, destination))
+
+    def get_primitives(self, origin, destination):
+        self.get_route(origin, destination)
+        return self.primitives[(origin, destination)]
+
+    def get_queue(self, origin, destination):
+        '''
+        returns a new primitive queue that walks a pedestrian from origin to destination
+        '''
+        prim_queue = Queue()
+        prim_queue._queue = list(reversed(self.get_primitives(origin, destination))) # the top is the last element
+        return prim_queue
+
+    def get_initial_state(self, origin, destination):
+        '''
+        returns the state (x, y, theta, gait) of a pedestrian at origin facing the first waypoint of the route
+        '''
+        route = self.get_route(origin, destination)
+        theta = np.arctan2(route[1][1] - route[0][1], route[1][0] - route[0][0])
+        return [route[0][0], route[0][1], theta, 0]
+
+# process-wide cache, the table of the default graph is built at most once per set of parameters
+_route_tables = dict()
+
+def get_route_table(walking_speed=walking_speed, crossing_wait=0.):
+    '''
+    returns the shared route table of prepare.pedestrian_waypoint_graph
+    '''
+    key = (walking_speed, crossing_wait)
+    if key not in _route_tables:
+        _route_tables[key] = RouteTable(walking_speed = walking_speed, crossing_wait = crossing_wait)
+    return _route_tables[key]
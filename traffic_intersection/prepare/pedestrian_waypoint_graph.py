@@ -5,29 +5,13 @@
 
 import os
 import numpy as np
+visualize = True
 if __name__ == '__main__':
     from graph import WeightedDirectedGraph
 else:
-    from traffic_intersection.prepare.graph import WeightedDirectedGraph
-import matplotlib.pyplot as plt
-from PIL import Image
-dir_path = os.path.dirname(os.path.realpath(__file__))
-intersection_fig = os.path.dirname(dir_path) + "/components/imglib/intersection.png"
-fig = plt.figure()
-
-# turn on/off axes
-plt.axis("on")
-background = Image.open(intersection_fig)
-xlim, ylim = background.size
-plt.xlim(0, xlim)
-plt.ylim(0, ylim)
-
-plt.imshow(background, origin="Lower")
-
-markersize = 30
-edge_width = 0.5
-head_width = 10
-transparency = 0.5
+    # if this file is not called directly, don't plot
+    from prepare.graph import WeightedDirectedGraph
+    visualize = False
 
 G = WeightedDirectedGraph()
 # define sources/sinks
@@ -107,22 +91,37 @@ all_edges = [
              (right_top, wait_top_right),
              (top_right, wait_top_right),
              (wait_top_right_horizontal, wait_top_right),
-             (wait_top_right_vertical, wait_top_right),
+             (wait_top_right_vertical, wait_top_right)
+        ]
 
+# crosswalks, pedestrians cross the road along these edges
+crossings = [
              (wait_bottom_left_vertical, wait_top_left_vertical),
              (wait_bottom_left_horizontal, wait_bottom_right_horizontal),
              (wait_top_right_vertical, wait_bottom_right_vertical),
              (wait_top_right_horizontal, wait_top_left_horizontal)
         ]
-
-# add weights as physical distances
-for edge in all_edges:
-    node_1 = edge[0]
-    node_2 = edge[1]
-    weight = np.linalg.norm(np.array(edge[0]) - np.array(edge[1]))
-    G.add_double_edges([(node_1, node_2, weight)])
-
-G.print_graph()
-G.plot_edges(plt, alpha = transparency, edge_width = edge_width, head_width=head_width,
-        plt_src_snk=False)
-plt.show()
+all_edges += crossings
+
+# weights are the physical distances, pedestrians walk both ways
+G.add_double_edges(all_edges)
+
+if visualize:
+    import matplotlib.pyplot as plt
+    from PIL import Image
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    intersection_fig = os.path.dirname(dir_path) + "/components/imglib/intersection.png"
+    fig = plt.figure()
+    plt.axis("on") # turn on/off axes
+    background = Image.open(intersection_fig)
+    xlim, ylim = background.size
+    plt.xlim(0, xlim)
+    plt.ylim(0, ylim)
+    plt.imshow(background, origin="Lower")
+    edge_width = 0.5
+    head_width = 10
+    transparency = 0.5
+    G.print_graph()
+    G.plot_edges(plt, alpha = transparency, edge_width = edge_width, head_width = head_width,
+            plt_src_snk = False)
+    plt.show()
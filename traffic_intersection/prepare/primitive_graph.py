@@ -0,0 +1,56 @@
+# Primitive Graph
+
+import os
+import scipy.io
+import prepare.car_waypoint_graph as car_graph
+import prepare.graph as graph
+
+# set dir_path to current directory
+dir_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+# load primitive data
+primitive_data = dir_path + '/primitives/MA3.mat'
+mat = scipy.io.loadmat(primitive_data)
+num_of_prims = mat['MA3'].shape[0]
+
+def get_prim_data(prim_id, data_field):
+    '''
+    This function simplifies the process of extracting data from the .mat file
+    Input:
+    prim_id: the index of the primitive the data of which we would like to return
+    data_field: name of the data field (e.g., x0, x_f, controller_found etc.)
+
+    Output: the requested data
+    '''
+    return mat['MA3'][prim_id,0][data_field][0,0][:,0]
+
+def build_primitive_graph():
+    '''
+    returns the weighted directed graph whose edges are the primitives (with a controller) weighted by their duration,
+    sources and sinks are the primitive nodes located at the sources and sinks of the car waypoint graph
+    '''
+    G = graph.WeightedDirectedGraph() # primitive graph
+    for prim_id in range(0, num_of_prims):
+        try:
+            controller_found = get_prim_data(prim_id, 'controller_found')[0]
+            if controller_found:
+                from_node = tuple(get_prim_data(prim_id, 'x0'))
+                to_node = tuple(get_prim_data(prim_id, 'x_f'))
+                time_weight = get_prim_data(prim_id, 't_end')[0]
+                new_edge = (from_node, to_node, time_weight)
+                new_edge_set = [new_edge] # convert to tuple otherwise, not hashable (can't check set membership)
+
+                G.add_edges(new_edge_set, use_euclidean_weight=False)
+
+                from_x = from_node[2]
+                from_y = from_node[3]
+
+                to_x = to_node[2]
+                to_y = to_node[3]
+
+                if (from_x, from_y) in car_graph.G._sources:
+                    G.add_source(from_node)
+                if (to_x, to_y) in car_graph.G._sinks:
+                    G.add_sink(to_node)
+        except ValueError:
+            pass
+    return G
@@ -0,0 +1,136 @@
+# Intersection Backgrounds
+#
+# The nine backgrounds (one per pair of horizontal and vertical light colors) are decoded once per process, optionally
+# with the waypoint graph drawn on top. A Framebuffer selects the background of the current light state at every
+# frame and only copies it when something is drawn onto it.
+
+import os
+import numpy as np
+from PIL import Image, ImageDraw
+
+dir_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+intersection_fig = dir_path + "/components/imglib/intersection_states/intersection_"
+light_colors = ['green', 'yellow', 'red']
+
+def draw_waypoint_graph(image, graph, edge_color=(255, 0, 0, 128), source_color=(255, 0, 0, 160),
+        sink_color=(0, 0, 255, 160), edge_width=2, node_radius=6):
+    '''
+    returns a copy of the RGBA PIL image with the edges of graph drawn as lines and its sources and sinks as dots, a
+    node is (x, y, ...), image rows are y coordinates since backgrounds are shown with origin="lower"
+    '''
+    overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    for start_node in graph._edges:
+        for end_node in graph._edges[start_node]:
+            draw.line([tuple(start_node[0:2]), tuple(end_node[0:2])], fill = edge_color, width = edge_width)
+    for nodes, color in [(graph._sources, source_color), (graph._sinks, sink_color)]:
+        for node in nodes:
+            x, y = node[0:2]
+            draw.ellipse([x - node_radius, y - node_radius, x + node_radius, y + node_radius], fill = color)
+    return Image.alpha_composite(image.convert('RGBA'), overlay)
+
+class Backgrounds():
+    '''
+    Backgrounds Class
+
+    Holds the nine intersection backgrounds as shared read-only RGBA arrays and PIL images keyed by
+    (horizontal light color, vertical light color). If graphs is given, every waypoint graph in it is drawn on top.
+
+    '''
+    def __init__(self, graphs=None):
+        self.arrays = dict()
+        self.images = dict()
+        for horizontal_light in light_colors:
+            for vertical_light in light_colors:
+                image = Image.open(intersection_fig + horizontal_light + '_' + vertical_light + '.png').convert('RGBA')
+                image.load()
+                for graph in graphs or []:
+                    image = draw_waypoint_graph(image, graph)
+                array = np.array(image)
+                array.flags.writeable = False
+                self.arrays[(horizontal_light, vertical_light)] = array
+                self.images[(horizontal_light, vertical_light)] = image
+        self.size = self.images[('red', 'red')].size
+
+    def get_array(self, horizontal_light, vertical_light):
+        return self.arrays[(horizontal_light, vertical_light)]
+
+    def get_image(self, horizontal_light, vertical_light):
+        '''
+        returns the shared PIL image of the light state, the image must not be modified in place
+        '''
+        return self.images[(horizontal_light, vertical_light)]
+
+# process-wide backgrounds, keyed by whether the waypoint graph is shown
+_backgrounds = dict()
+
+def get_backgrounds(show_waypoint_graph=False):
+    if show_waypoint_graph not in _backgrounds:
+        graphs = None
+        if show_waypoint_graph:
+            import prepare.car_waypoint_graph as car_graph
+            graphs = [car_graph.G]
+        _backgrounds[show_waypoint_graph] = Backgrounds(graphs)
+    return _backgrounds[show_waypoint_graph]
+
+class Framebuffer():
+    '''
+    Framebuffer Class
+
+    Copy-on-write frame: after select(), get_image() and get_array() return the shared background of the light state
+    until get_writable_image() or get_writable_array() is called, which copy it once for the rest of the frame. A frame
+    should be drawn either through the PIL image or through the array, not both.
+
+    '''
+    def __init__(self, backgrounds=None, traffic_lights=None):
+        if backgrounds is None:
+            backgrounds = get_backgrounds()
+        self.backgrounds = backgrounds
+        self.traffic_lights = traffic_lights
+        self.light_state = ('red', 'red')
+        self._image = None
+        self._array = None
+        if traffic_lights is not None:
+            self.update()
+
+    def select(self, horizontal_light, vertical_light):
+        '''
+        starts a new frame on the background of the given light colors
+        '''
+        self.light_state = (horizontal_light, vertical_light)
+        self._image = None
+        self._array = None
+
+    def update(self):
+        '''
+        starts a new frame on the background of the current state of traffic_lights
+        '''
+        self.select(self.traffic_lights.get_states('horizontal', 'color'),
+                self.traffic_lights.get_states('vertical', 'color'))
+
+    def is_dirty(self):
+        return self._image is not None or self._array is not None
+
+    def get_image(self):
+        if self._image is not None:
+            return self._image
+        if self._array is not None:
+            return Image.fromarray(self._array, 'RGBA')
+        return self.backgrounds.get_image(*self.light_state)
+
+    def get_array(self):
+        if self._array is not None:
+            return self._array
+        if self._image is not None:
+            return np.asarray(self._image)
+        return self.backgrounds.get_array(*self.light_state)
+
+    def get_writable_image(self):
+        if self._image is None:
+            self._image = self.backgrounds.get_image(*self.light_state).copy()
+        return self._image
+
+    def get_writable_array(self):
+        if self._array is None:
+            self._array = self.backgrounds.get_array(*self.light_state).copy()
+        return self._array
@@ -0,0 +1,256 @@
+# State Broadcast Server
+#
+# Publishes the state of a running simulation to viewers in other processes (see rendering/remote_viewer.py) over TCP
+# or a Unix socket. The server runs an asyncio event loop in a background thread; publishing only encodes the
+# snapshot and hands it to the loop, so the simulation never waits for a viewer. Every client keeps only the latest
+# message: messages that arrive faster than the rate of the client (the rate of the server, or less if the client
+# asks for it with a line "rate <messages per second>") are dropped, and a client that does not take a message within
+# drain_timeout seconds is disconnected. Run a headless simulation with a server from the traffic_intersection folder
+#     python -m rendering.broadcast --port 8765 --realtime
+#
+# A message is a little-endian uint32 length followed by the header (see header) and the arrays
+#     car ids int64, car states float32 (v, theta, x, y), car colors uint8, car primitive ids int32,
+#     pedestrian ids int64, pedestrian states float32 (x, y, theta, gait), pedestrian types uint8,
+#     colliding agent ids int64, honk wavefronts float32 (x, y, size, intensity)
+# colors, pedestrian types and lights are indices into the lists of simulation.recorder.
+
+import asyncio
+import struct
+import threading
+import numpy as np
+from rendering.pipeline import CarSnapshot, PedestrianSnapshot, Snapshot, take_snapshot
+from simulation.recorder import car_colors, light_colors, pedestrian_types
+
+magic = b'TIS1'
+length = struct.Struct('<I')
+header = struct.Struct('<4sdqBBIIII') # magic, time, frame_idx, lights, numbers of cars, pedestrians, colliding, waves
+film_dim = (1, 6)
+
+def encode_snapshot(snapshot):
+    '''
+    returns the message of a snapshot of rendering.pipeline.take_snapshot, including its length prefix
+    '''
+    cars, pedestrians = snapshot.cars, snapshot.pedestrians
+    car_states = np.array([car.state for car in cars], dtype=np.float32).reshape(-1, 4)
+    pedestrian_states = np.array([person.state for person in pedestrians], dtype=np.float32).reshape(-1, 4)
+    wavefronts = np.asarray(snapshot.wavefronts, dtype=np.float32).reshape(-1, 4)
+    parts = [header.pack(magic, snapshot.time, snapshot.frame_idx, light_colors.index(snapshot.light_state[0]),
+                light_colors.index(snapshot.light_state[1]), len(cars), len(pedestrians), len(snapshot.colliding),
+                len(wavefronts)),
+             np.array([car.agent_id for car in cars], dtype=np.int64).tobytes(), car_states.tobytes(),
+             np.array([car_colors.index(car.color) for car in cars], dtype=np.uint8).tobytes(),
+             np.array([car.prim_id for car in cars], dtype=np.int32).tobytes(),
+             np.array([person.agent_id for person in pedestrians], dtype=np.int64).tobytes(), pedestrian_states.tobytes(),
+             np.array([pedestrian_types.index(person.pedestrian_type) for person in pedestrians],
+                dtype=np.uint8).tobytes(),
+             np.array(sorted(snapshot.colliding), dtype=np.int64).tobytes(), wavefronts.tobytes()]
+    payload = b''.join(parts)
+    return length.pack(len(payload)) + payload
+
+def decode_snapshot(payload):
+    '''
+    returns the snapshot of a message without its length prefix
+    '''
+    tag, time, frame_idx, horizontal_light, vertical_light, num_cars, num_pedestrians, num_colliding, num_waves = \
+            header.unpack_from(payload)
+    if tag != magic:
+        raise ValueError('not a snapshot message')
+    offset = header.size
+    def take(dtype, count, shape=None):
+        nonlocal offset
+        array = np.frombuffer(payload, dtype = dtype, count = count, offset = offset)
+        offset += array.nbytes
+        return array if shape is None else array.reshape(shape)
+    car_ids = take(np.int64, num_cars)
+    car_states = take(np.float32, 4 * num_cars, (num_cars, 4)).astype(float)
+    colors = take(np.uint8, num_cars)
+    prim_ids = take(np.int32, num_cars)
+    pedestrian_ids = take(np.int64, num_pedestrians)
+    pedestrian_states = take(np.float32, 4 * num_pedestrians, (num_pedestrians, 4)).astype(float)
+    types = take(np.uint8, num_pedestrians)
+    colliding = take(np.int64, num_colliding)
+    wavefronts = take(np.float32, 4 * num_waves, (num_waves, 4)).astype(float)
+    cars = tuple(CarSnapshot(int(car_ids[k]), car_states[k], car_colors[colors[k]], int(prim_ids[k]))
+            for k in range(num_cars))
+    pedestrians = tuple(PedestrianSnapshot(int(pedestrian_ids[k]), pedestrian_states[k], pedestrian_types[types[k]],
+            film_dim) for k in range(num_pedestrians))
+    return Snapshot(frame_idx, time, (light_colors[horizontal_light], light_colors[vertical_light]), cars,
+            pedestrians, frozenset(colliding.tolist()), wavefronts)
+
+class Subscriber():
+    '''
+    Subscriber Class
+
+    One connected client of the server. A sender task writes the latest message at most rate times per second;
+    messages replaced before they were sent count as dropped.
+
+    '''
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.rate = server.max_rate
+        self.message = None
+        self.new_message = asyncio.Event()
+        self.num_sent = 0
+        self.num_dropped = 0
+
+    def offer(self, message):
+        if self.message is not None:
+            self.num_dropped += 1
+        self.message = message
+        self.new_message.set()
+
+    async def send(self):
+        loop = asyncio.get_running_loop()
+        last_time = -np.inf
+        while True:
+            await self.new_message.wait()
+            wait = last_time + 1. / self.rate - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait) # newer messages replace the waiting one meanwhile
+            self.new_message.clear()
+            message, self.message = self.message, None
+            last_time = loop.time()
+            self.writer.write(message)
+            await asyncio.wait_for(self.writer.drain(), self.server.drain_timeout)
+            self.num_sent += 1
+
+    async def listen(self):
+        async for line in self.reader:
+            words = line.decode(errors = 'replace').split()
+            if len(words) == 2 and words[0] == 'rate':
+                try:
+                    self.rate = min(max(float(words[1]), 1e-3), self.server.max_rate)
+                except ValueError:
+                    pass
+
+    async def run(self):
+        sender = asyncio.ensure_future(self.send())
+        listener = asyncio.ensure_future(self.listen())
+        try:
+            # the client hung up, or it was too slow to take a message
+            await asyncio.wait([sender, listener], return_when = asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            listener.cancel()
+            self.writer.close()
+
+class BroadcastServer():
+    '''
+    Broadcast Server Class
+
+    Serves snapshots on host:port, or on the Unix socket path if given. publish(simulator) or calling the server as an
+    observer of the simulator sends the current state to all clients, at most max_rate times per second each.
+
+    '''
+    def __init__(self, host='127.0.0.1', port=8765, path=None, max_rate=30., drain_timeout=1.):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_rate = max_rate
+        self.drain_timeout = drain_timeout
+        self.subscribers = set()
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        '''
+        starts the event loop thread and returns once the server is listening
+        '''
+        started = threading.Event()
+        errors = []
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                if self.path is not None:
+                    self.server = self.loop.run_until_complete(asyncio.start_unix_server(self.accept, path = self.path))
+                else:
+                    self.server = self.loop.run_until_complete(asyncio.start_server(self.accept, self.host, self.port))
+                    self.port = self.server.sockets[0].getsockname()[1] # the chosen port if port was 0
+            except OSError as error:
+                errors.append(error)
+                started.set()
+                return
+            started.set()
+            self.loop.run_forever()
+            # stop listening and hang up on all clients
+            self.server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions = True))
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+        self.thread = threading.Thread(target = serve, daemon = True)
+        self.thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    async def accept(self, reader, writer):
+        subscriber = Subscriber(self, reader, writer)
+        self.subscribers.add(subscriber)
+        try:
+            await subscriber.run()
+        except (ConnectionError, asyncio.TimeoutError, asyncio.CancelledError): # CancelledError when the server closes
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def broadcast(self, message):
+        for subscriber in self.subscribers:
+            subscriber.offer(message)
+
+    def publish_snapshot(self, snapshot):
+        self.loop.call_soon_threadsafe(self.broadcast, encode_snapshot(snapshot))
+
+    def publish(self, simulator):
+        '''
+        sends the current state of simulator to all clients, does nothing without clients
+        '''
+        if len(self.subscribers) > 0:
+            self.publish_snapshot(take_snapshot(simulator))
+
+    def __call__(self, simulator): # observer interface
+        self.publish(simulator)
+
+    def close(self):
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exception):
+        self.close()
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    import prepare.primitive_graph as primitive_graph
+    from simulation.simulator import Simulator
+    parser = argparse.ArgumentParser(description='Run a headless simulation and publish its state')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='path of a Unix socket to serve on instead of TCP')
+    parser.add_argument('--max-rate', type=float, default=30., help='messages per second per client')
+    parser.add_argument('--duration', type=float, default=None, help='simulated seconds, forever by default')
+    parser.add_argument('--dt', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--spawn-probability', type=float, default=1.)
+    parser.add_argument('--realtime', action='store_true', help='keep the simulation at wall clock speed')
+    args = parser.parse_args()
+    simulator = Simulator(primitive_graph.build_primitive_graph(), dt = args.dt, seed = args.seed,
+            spawn_probability = args.spawn_probability)
+    with BroadcastServer(args.host, args.port, args.unix, max_rate = args.max_rate) as server:
+        print('serving on {}'.format(args.unix if args.unix is not None else '{}:{}'.format(args.host, server.port)))
+        simulator.add_observer(server)
+        start_time = time.time()
+        while args.duration is None or simulator.time < args.duration:
+            simulator.step()
+            if args.realtime:
+                time.sleep(max(start_time + simulator.time - time.time(), 0))
@@ -0,0 +1,78 @@
+# Pose Interpolation
+#
+# Renders a recording at any frame rate, independently of the simulation step. The pose of every agent at a frame
+# time is interpolated between the two recorded ticks around it: positions and speeds linearly, headings along the
+# shorter arc. The pedestrian gait, the traffic lights and the collisions are discrete and taken from the earlier tick.
+
+from types import SimpleNamespace
+import numpy as np
+from simulation.recorder import CAR
+
+# index of the heading in the state vector, cars are (v, theta, x, y) and pedestrians (x, y, theta, gait)
+car_heading, pedestrian_heading = 1, 2
+
+def wrap_angle(theta):
+    '''
+    maps angles to [-pi, pi)
+    '''
+    return (theta + np.pi) % (2 * np.pi) - np.pi
+
+def interpolate_angle(theta_1, theta_2, s):
+    '''
+    returns the angle a fraction s of the way from theta_1 to theta_2 along the shorter arc
+    '''
+    return theta_1 + s * wrap_angle(theta_2 - theta_1)
+
+def interpolate_states(kinds, states_1, states_2, s):
+    '''
+    interpolates the state vectors of agents between two ticks
+    input:  kinds - (n,) agent kinds, CAR or PEDESTRIAN
+            states_1, states_2 - (n, 4) states of the same agents at the earlier and the later tick
+            s - fraction of the way from the earlier to the later tick, between 0 and 1
+    output: (n, 4) interpolated states
+    '''
+    states = states_1 + s * (states_2 - states_1)
+    is_car = kinds == CAR
+    states[is_car, car_heading] = interpolate_angle(states_1[is_car, car_heading], states_2[is_car, car_heading], s)
+    states[~is_car, pedestrian_heading] = interpolate_angle(states_1[~is_car, pedestrian_heading],
+            states_2[~is_car, pedestrian_heading], s)
+    states[~is_car, 3] = states_1[~is_car, 3] # gait
+    return states
+
+def interpolate_columns(columns_1, columns_2, s):
+    '''
+    returns the agent columns of the earlier tick with the states of agents that are in both ticks interpolated,
+    agents that leave before the later tick stay where they are
+    '''
+    columns = dict(columns_1)
+    _, rows_1, rows_2 = np.intersect1d(columns_1['agent_id'], columns_2['agent_id'], assume_unique = True,
+            return_indices = True)
+    states = columns_1['state'].copy()
+    states[rows_1] = interpolate_states(columns_1['kind'][rows_1], columns_1['state'][rows_1],
+            columns_2['state'][rows_2], s)
+    columns['state'] = states
+    return columns
+
+def get_frame(replay, time):
+    '''
+    returns the recorded scene at time in the form of Replay.get_tick, interpolated between the ticks around time
+    '''
+    index = replay.seek(time)
+    if index + 1 >= replay.num_ticks or time <= replay.times[index]:
+        return replay.get_tick(index)
+    time_1, time_2 = replay.times[index], replay.times[index + 1]
+    s = (time - time_1) / (time_2 - time_1)
+    columns = interpolate_columns(replay.get_columns(index), replay.get_columns(index + 1), s)
+    cars, pedestrians = replay.get_agents(columns)
+    return SimpleNamespace(index = index, time = float(time), frame_idx = int(replay.ticks['frame_idx'][index]),
+            light_state = replay.get_light_state(index), cars = cars, pedestrians = pedestrians,
+            collisions = replay.get_collisions(index))
+
+def get_frame_times(replay, frame_rate):
+    '''
+    returns the times of frames frame_rate times per simulated second from the first to the last tick of replay
+    '''
+    if replay.num_ticks == 0:
+        return np.zeros(0)
+    start, end = replay.times[0], replay.times[-1]
+    return start + np.arange(int(np.floor((end - start) * frame_rate + 1e-9)) + 1) / frame_rate
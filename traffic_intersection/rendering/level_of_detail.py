@@ -0,0 +1,90 @@
+# Level of Detail
+#
+# With many agents on screen the sprites are slow to draw and hard to read. Above box_threshold agents the live view
+# draws every agent as a filled bounding box (cars as rectangles, pedestrians as diamonds, the same polygons as
+# prepare.collision_check.get_bounding_box) in a single collection, above heatmap_threshold agents it only shows a
+# density map of the agents over the background.
+
+import numpy as np
+import scipy.ndimage
+import assumes.params as params
+
+SPRITES, BOXES, HEATMAP = 'sprites', 'boxes', 'heatmap'
+
+# unrotated bounding box corners relative to the box center, counter clockwise as in prepare.collision_check
+car_half_width, car_half_height = 788 * params.car_scale_factor / 2., 399 * params.car_scale_factor / 2.
+car_corners = np.array([[-car_half_width, -car_half_height], [car_half_width, -car_half_height],
+    [car_half_width, car_half_height], [-car_half_width, car_half_height]])
+pedestrian_half_width, pedestrian_half_height = 27 * params.pedestrian_scale_factor, 35 * params.pedestrian_scale_factor
+pedestrian_corners = np.array([[-pedestrian_half_width, 0], [0, -pedestrian_half_height], [pedestrian_half_width, 0],
+    [0, pedestrian_half_height]])
+
+class LevelOfDetail():
+    '''
+    Level of Detail Class
+
+    Picks how agents are drawn from their number: SPRITES up to box_threshold agents, BOXES up to heatmap_threshold
+    agents and HEATMAP above. A threshold of None disables its level.
+
+    '''
+    def __init__(self, box_threshold=150, heatmap_threshold=1000):
+        self.box_threshold = box_threshold
+        self.heatmap_threshold = heatmap_threshold
+
+    def select(self, num_agents):
+        if self.heatmap_threshold is not None and num_agents > self.heatmap_threshold:
+            return HEATMAP
+        if self.box_threshold is not None and num_agents > self.box_threshold:
+            return BOXES
+        return SPRITES
+
+def get_states(agents):
+    '''
+    returns the (n, 4) array of the states of agents
+    '''
+    return np.array([np.ravel(agent.state)[0:4] for agent in agents], dtype=float).reshape(-1, 4)
+
+def rotate_corners(corners, x, y, theta):
+    '''
+    returns the (n, k, 2) corners rotated by theta and moved to (x, y), one polygon per agent
+    '''
+    cos, sin = np.cos(theta)[:, None], np.sin(theta)[:, None]
+    return np.stack([x[:, None] + corners[:, 0] * cos - corners[:, 1] * sin,
+                     y[:, None] + corners[:, 0] * sin + corners[:, 1] * cos], axis = -1)
+
+def get_car_polygons(cars):
+    '''
+    returns the (n, 4, 2) bounding boxes of cars, the boxes are centered between the axles like in get_bounding_box
+    '''
+    states = get_states(cars)
+    vee, theta, x, y = states.T
+    r = params.center_to_axle_dist * params.car_scale_factor
+    return rotate_corners(car_corners, x + r * np.cos(theta), y + r * np.sin(theta), theta)
+
+def get_pedestrian_polygons(pedestrians):
+    '''
+    returns the (n, 4, 2) bounding diamonds of pedestrians
+    '''
+    states = get_states(pedestrians)
+    x, y, theta, gait = states.T
+    return rotate_corners(pedestrian_corners, x, y, theta)
+
+def get_positions(cars=(), pedestrians=()):
+    '''
+    returns the (n, 2) positions of cars and pedestrians
+    '''
+    car_states = get_states(cars)
+    pedestrian_states = get_states(pedestrians)
+    return np.vstack([car_states[:, 2:4], pedestrian_states[:, 0:2]])
+
+def get_density(positions, width, height, cell_size=20, smoothing=1.):
+    '''
+    returns the number of agents per cell of a grid of cell_size pixels over a width by height image, smoothed by a
+    gaussian filter of smoothing cells
+    '''
+    x_bins = np.arange(0, width + cell_size, cell_size)
+    y_bins = np.arange(0, height + cell_size, cell_size)
+    density, _, _ = np.histogram2d(positions[:, 1], positions[:, 0], bins = (y_bins, x_bins))
+    if smoothing > 0:
+        density = scipy.ndimage.gaussian_filter(density, smoothing)
+    return density
@@ -0,0 +1,173 @@
+# Live View
+#
+# Clearing the axes and creating new artists at every frame (one line per bounding box, five per tube, a new scatter
+# and a new image) makes blitting useless. The live view creates its artists once and only updates their data.
+
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from prepare.collision_check import get_state_bounding_box
+import primitives.tubes as tubes
+import rendering.level_of_detail as level_of_detail
+
+# tube outlines per primitive id, each a list of closed polygons
+_tube_outlines = dict()
+
+def get_tube_outlines(prim_id, num_of_tubes=5):
+    '''
+    returns the first num_of_tubes tube outlines of a primitive as closed (n, 2) arrays
+    '''
+    if (prim_id, num_of_tubes) not in _tube_outlines:
+        outlines = []
+        for vertex_set in tubes.make_tube(prim_id)[0:num_of_tubes]:
+            outline = np.array([[float(np.ravel(vertex[0])[0]), float(np.ravel(vertex[1])[0])] for vertex in vertex_set])
+            outlines.append(np.vstack([outline, outline[0:1]]))
+        _tube_outlines[(prim_id, num_of_tubes)] = outlines
+    return _tube_outlines[(prim_id, num_of_tubes)]
+
+def get_box_outline(agent):
+    '''
+    returns the closed bounding box outline of a car or a pedestrian, or of a stand-in with a state and a color (cars)
+    or a pedestrian_type (pedestrians) like the agents of a snapshot or a replay
+    '''
+    vertex_set, _, _, _ = get_state_bounding_box(np.ravel(agent.state)[0:4], is_car = hasattr(agent, 'color'))
+    outline = np.array([[float(vertex[0]), float(vertex[1])] for vertex in vertex_set])
+    return np.vstack([outline, outline[0:1]])
+
+def get_prim_id(car):
+    '''
+    returns the id of the current primitive of a car or of a stand-in with a prim_id, -1 if there is none
+    '''
+    if not hasattr(car, 'prim_queue'):
+        return car.prim_id
+    if car.prim_queue.len() == 0:
+        return -1
+    return car.prim_queue.top()[0]
+
+def get_wavefront_data(wavefronts):
+    '''
+    returns the (x, y, size, intensity) rows of honk wavefronts as an (n, 4) array
+    '''
+    return np.array([wave.get_data() for wave in wavefronts], dtype=float).reshape(-1, 4)
+
+class LiveView():
+    '''
+    Live View Class
+
+    Owns the persistent artists of an animation: one AxesImage for the frame, one LineCollection for the bounding
+    boxes, one for the primitive tubes and one scatter for the honking wavefronts. Call update() at every frame and
+    return artists from the animation function. Every box is shown with probability box_probability and every tube
+    with probability tube_probability at every frame, drawn from the numpy generator rng (e.g. the display stream of
+    simulation.random_streams.RandomStreams). At the BOXES and HEATMAP levels of rendering.level_of_detail the
+    agents are shown as one PolyCollection of filled boxes or as a density image instead, the frame should then be
+    rendered without sprites.
+
+    '''
+    def __init__(self, ax, width=1062, height=762, box_probability=1., tube_probability=1., num_of_tubes=5,
+            cell_size=20, rng=None):
+        self.ax = ax
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.box_probability = box_probability
+        self.tube_probability = tube_probability
+        self.num_of_tubes = num_of_tubes
+        self.image = ax.imshow(np.zeros((height, width, 4), dtype=np.uint8), origin="lower", animated=True)
+        self.honk_waves = ax.scatter([], [], s=[], lw=1, facecolors='none', edgecolors=[], animated=True)
+        self.boxes = LineCollection([], colors='g', animated=True)
+        self.tubes = LineCollection([], colors='b', animated=True)
+        self.agent_boxes = PolyCollection([], edgecolors='k', linewidths=0.5, animated=True)
+        ax.add_collection(self.boxes)
+        ax.add_collection(self.tubes)
+        ax.add_collection(self.agent_boxes)
+        num_rows, num_columns = -(-height // cell_size), -(-width // cell_size)
+        self.density = ax.imshow(np.ma.masked_all((num_rows, num_columns)), origin="lower", cmap='inferno', alpha=0.7,
+                extent=(-0.5, num_columns * cell_size - 0.5, -0.5, num_rows * cell_size - 0.5),
+                interpolation='bilinear', animated=True)
+        # keep the limits of the image, adding collections must not rescale the axes
+        ax.set_xlim(-0.5, width - 0.5)
+        ax.set_ylim(-0.5, height - 0.5)
+        self.artists = [self.image, self.density, self.honk_waves, self.boxes, self.tubes, self.agent_boxes]
+
+    def update_image(self, frame):
+        self.image.set_data(frame)
+
+    def update_honking(self, wavefronts):
+        '''
+        shows honk wavefronts, given either as wavefront objects or as the array of get_wavefront_data
+        '''
+        data = wavefronts if isinstance(wavefronts, np.ndarray) else get_wavefront_data(wavefronts)
+        rgba_colors = np.zeros((len(data), 4))
+        rgba_colors[:, 0] = 1.0 # red color
+        rgba_colors[:, 3] = data[:, 3] # intensities
+        self.honk_waves.set_offsets(data[:, 0:2])
+        self.honk_waves.set_sizes(data[:, 2])
+        self.honk_waves.set_edgecolors(rgba_colors)
+
+    def update_boxes(self, agents, colliding=()):
+        '''
+        shows the bounding boxes of agents, red for the agents whose agent_id is in colliding and green otherwise
+        '''
+        segments = []
+        colors = []
+        for agent in agents:
+            if self.rng.random() <= self.box_probability:
+                segments.append(get_box_outline(agent))
+                colors.append('r' if agent.agent_id in colliding else 'g')
+        self.boxes.set_segments(segments)
+        self.boxes.set_color(colors)
+
+    def update_tubes(self, cars):
+        '''
+        shows the tubes of the current primitive of every car
+        '''
+        segments = []
+        for car in cars:
+            prim_id = get_prim_id(car)
+            if prim_id != -1:
+                for outline in get_tube_outlines(prim_id, self.num_of_tubes):
+                    if self.rng.random() <= self.tube_probability:
+                        segments.append(outline)
+        self.tubes.set_segments(segments)
+
+    def update_agent_boxes(self, cars=(), pedestrians=(), colliding=()):
+        '''
+        shows all agents as filled boxes in the color of the car, orange for pedestrians and red if colliding
+        '''
+        polygons = np.concatenate([level_of_detail.get_car_polygons(cars),
+            level_of_detail.get_pedestrian_polygons(pedestrians)])
+        colors = [car.color for car in cars] + ['orange'] * len(pedestrians)
+        colors = ['r' if agent.agent_id in colliding else color
+                for agent, color in zip(list(cars) + list(pedestrians), colors)]
+        self.agent_boxes.set_verts(polygons)
+        self.agent_boxes.set_facecolors(colors)
+
+    def update_density(self, cars=(), pedestrians=()):
+        '''
+        shows the density of agents per cell, empty cells are transparent
+        '''
+        density = level_of_detail.get_density(level_of_detail.get_positions(cars, pedestrians), self.width,
+                self.height, self.cell_size)
+        self.density.set_data(np.ma.masked_less(density, 0.05))
+        self.density.set_clim(0, max(density.max(), 1.))
+
+    def update(self, frame, cars=(), colliding=(), wavefronts=(), pedestrians=(), level=level_of_detail.SPRITES):
+        '''
+        updates all artists and returns them, level is the level of detail of the agents
+        '''
+        self.update_image(frame)
+        self.update_honking(wavefronts)
+        if level == level_of_detail.SPRITES:
+            self.update_boxes(cars, colliding)
+            self.update_tubes(cars)
+        else: # one outline and five tubes per agent would be as slow as the sprites
+            self.update_boxes((), colliding)
+            self.update_tubes(())
+        self.density.set_visible(level == level_of_detail.HEATMAP)
+        if level == level_of_detail.BOXES:
+            self.update_agent_boxes(cars, pedestrians, colliding)
+        else:
+            self.update_agent_boxes()
+        if level == level_of_detail.HEATMAP:
+            self.update_density(cars, pedestrians)
+        return self.artists
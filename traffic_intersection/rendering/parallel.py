@@ -0,0 +1,135 @@
+# Parallel Rendering of Recordings
+#
+# Renders a recording (see simulation/recorder.py) into a video with a process pool. The ticks are split into
+# consecutive segments, every worker renders its segments into separate video files with its own renderer, and the
+# segments are joined by ffmpeg's concat demuxer without encoding them again. With a sample rate the frames are not
+# the recorded ticks but interpolated poses at that many frames per simulated second (see rendering/interpolation.py),
+# so a coarse simulation step still gives a smooth video. Run from the traffic_intersection folder, e.g.
+#     python -m simulation.recorder --duration 3600 --seed 0 --output run.npz
+#     python -m rendering.parallel run.npz --workers 32 --sample-rate 30 --output run.mp4
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import imageio_ffmpeg
+import rendering.interpolation as interpolation
+from rendering.renderer import IncrementalRenderer
+from rendering.video import VideoExporter
+from simulation.recorder import Replay
+
+# replay and renderer of a worker process, created by the first segment the worker renders
+_replay = None
+_renderer = None
+
+def split_frames(num_frames, segment_size):
+    '''
+    returns the (start, end) frame ranges of consecutive segments of at most segment_size frames
+    '''
+    return [(start, min(start + segment_size, num_frames)) for start in range(0, num_frames, segment_size)]
+
+def get_scene(replay, index, sample_rate=None):
+    '''
+    returns the scene of frame index, the tick index if sample_rate is None and else the interpolated scene at index /
+    sample_rate simulated seconds after the first tick
+    '''
+    if sample_rate is None:
+        return replay.get_tick(index)
+    return interpolation.get_frame(replay, replay.times[0] + index / sample_rate)
+
+def render_segment(recording, start, end, file_name, fps, sample_rate, exporter_options):
+    '''
+    renders the frames start to end - 1 of recording into the video file_name and returns the number of frames
+    '''
+    global _replay, _renderer
+    if _replay is None or _replay.file_name != recording:
+        if _replay is not None:
+            _replay.close()
+        _replay = Replay(recording)
+        _renderer = IncrementalRenderer()
+    _renderer.reset() # segments of a worker are not consecutive
+    with VideoExporter(file_name, fps = fps, renderer = _renderer, **exporter_options) as exporter:
+        for index in range(start, end):
+            scene = get_scene(_replay, index, sample_rate)
+            exporter.write(_renderer.render(*scene.light_state, cars = scene.cars, pedestrians = scene.pedestrians))
+    return exporter.frames_written
+
+def concatenate_videos(segment_files, file_name):
+    '''
+    joins videos with identical encoding settings into file_name without encoding them again
+    '''
+    list_file = file_name + '.segments.txt'
+    with open(list_file, 'w') as f:
+        for segment_file in segment_files:
+            f.write("file '{}'\n".format(os.path.abspath(segment_file).replace("'", "'\\''")))
+    try:
+        subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+            '-i', list_file, '-c', 'copy', file_name], check = True)
+    finally:
+        os.remove(list_file)
+
+def render_recording(recording, file_name, max_workers=None, segment_size=None, fps=None, sample_rate=None,
+        **exporter_options):
+    '''
+    renders a recording into the video file_name with a process pool
+    input:  recording - file written by simulation.recorder.Recorder
+            max_workers - number of worker processes, the number of processors by default
+            segment_size - frames per segment, by default the frames are split evenly into four segments per worker
+            fps - frames per second of the video, real time by default
+            sample_rate - frames per simulated second, interpolated between the ticks; by default one frame per tick
+            exporter_options - resolution, codec, quality, bitrate and pixelformat of rendering.video.VideoExporter
+    output: number of frames written
+    '''
+    with Replay(recording) as replay:
+        if sample_rate is None:
+            num_frames = replay.num_ticks
+            real_time_fps = 1. / replay.metadata.get('dt', 0.1)
+        else:
+            num_frames = len(interpolation.get_frame_times(replay, sample_rate))
+            real_time_fps = sample_rate
+    if fps is None:
+        fps = real_time_fps
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    if segment_size is None:
+        segment_size = max(-(-num_frames // (4 * max_workers)), 1)
+    segments = split_frames(num_frames, segment_size)
+    segment_folder = tempfile.mkdtemp(prefix = 'segments_', dir = os.path.dirname(os.path.abspath(file_name)))
+    extension = os.path.splitext(file_name)[1]
+    segment_files = [os.path.join(segment_folder, '{:06d}{}'.format(k, extension)) for k in range(len(segments))]
+    try:
+        with ProcessPoolExecutor(max_workers = max_workers) as executor:
+            futures = [executor.submit(render_segment, recording, start, end, segment_file, fps, sample_rate,
+                    exporter_options) for (start, end), segment_file in zip(segments, segment_files)]
+            frames = sum(future.result() for future in futures)
+        concatenate_videos(segment_files, file_name)
+    finally:
+        shutil.rmtree(segment_folder)
+    return frames
+
+if __name__ == '__main__':
+    import time
+    parser = argparse.ArgumentParser(description='Render a recording into a video file with a process pool')
+    parser.add_argument('recording', help='file written by simulation.recorder')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--segment-size', type=int, default=None, help='frames per segment')
+    parser.add_argument('--sample-rate', type=float, default=None,
+            help='frames per simulated second interpolated between the ticks, one frame per tick by default')
+    parser.add_argument('--fps', type=float, default=None, help='frames per second, real time by default')
+    parser.add_argument('--codec', default='libx264')
+    parser.add_argument('--quality', type=float, default=None, help='0 (worst) to 10 (best)')
+    parser.add_argument('--bitrate', default=None)
+    parser.add_argument('--width', type=int, default=None, help='output width, needs --height')
+    parser.add_argument('--height', type=int, default=None, help='output height, needs --width')
+    parser.add_argument('--output', default='simulation.mp4')
+    args = parser.parse_args()
+    resolution = None
+    if args.width is not None and args.height is not None:
+        resolution = (args.width, args.height)
+    start_time = time.time()
+    frames = render_recording(args.recording, args.output, max_workers = args.workers, segment_size = args.segment_size,
+            fps = args.fps, sample_rate = args.sample_rate, codec = args.codec, resolution = resolution,
+            quality = args.quality, bitrate = args.bitrate)
+    print('wrote {} frames to {} in {:.1f} s'.format(frames, args.output, time.time() - start_time))
@@ -0,0 +1,289 @@
+# Render Pipeline
+#
+# Runs the simulation and the rendering concurrently. A producer thread steps the simulator and puts an immutable
+# snapshot of every step into a bounded queue, a consumer thread or process renders the snapshots into frames and the
+# GUI thread only shows the latest rendered frame. What happens when the queue is full is the policy of the pipeline:
+#     'block'        the producer waits for the consumer, no frame is lost and the simulation runs at render speed
+#     'drop_oldest'  the oldest waiting snapshot is discarded, the view stays as close to the simulation as possible
+#     'drop_newest'  the new snapshot is discarded, the frames already waiting are shown
+# A consumer process sidesteps the interpreter lock, the frames then come back pickled through a pipe. A consumer that
+# raises or dies makes put and get_latest raise instead of waiting for it forever.
+
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from collections import namedtuple
+import numpy as np
+from rendering.level_of_detail import SPRITES
+from rendering.live_view import get_prim_id, get_wavefront_data
+
+policies = ['block', 'drop_oldest', 'drop_newest']
+
+Snapshot = namedtuple('Snapshot', ['frame_idx', 'time', 'light_state', 'cars', 'pedestrians', 'colliding',
+    'wavefronts'])
+CarSnapshot = namedtuple('CarSnapshot', ['agent_id', 'state', 'color', 'prim_id'])
+PedestrianSnapshot = namedtuple('PedestrianSnapshot', ['agent_id', 'state', 'pedestrian_type', 'film_dim'])
+
+def freeze(array):
+    array = np.array(array, dtype=float)
+    array.flags.writeable = False
+    return array
+
+def take_snapshot(simulator):
+    '''
+    returns an immutable copy of everything needed to show the current state of simulator
+    '''
+    traffic_lights = simulator.traffic_lights
+    light_state = (traffic_lights.get_states('horizontal', 'color'), traffic_lights.get_states('vertical', 'color'))
+    cars = tuple(CarSnapshot(car.agent_id, freeze(np.ravel(car.state)[0:4]), car.color, get_prim_id(car))
+            for car in simulator.cars.values())
+    pedestrians = tuple(PedestrianSnapshot(person.agent_id, freeze(person.state), person.pedestrian_type,
+            tuple(person.film_dim)) for person in simulator.pedestrians)
+    colliding = frozenset(agent.agent_id for pair in simulator.collisions for agent in pair)
+    return Snapshot(simulator.frame_idx, simulator.time, light_state, cars, pedestrians, colliding,
+            freeze(get_wavefront_data(simulator.wavefronts)))
+
+class SnapshotRenderer():
+    '''
+    SnapshotRenderer Class
+
+    Consumer that renders a snapshot into a frame and returns (snapshot, frame). The renderer is created on the first
+    call, so a SnapshotRenderer can be sent to a consumer process before it holds any image. With a level_of_detail
+    (see rendering/level_of_detail.py) the sprites are left out when the live view draws the agents itself.
+
+    '''
+    def __init__(self, renderer_type='incremental', level_of_detail=None, **renderer_options):
+        self.renderer_type = renderer_type
+        self.level_of_detail = level_of_detail
+        self.renderer_options = renderer_options
+        self.renderer = None
+
+    def __call__(self, snapshot):
+        if self.renderer is None:
+            from rendering.renderer import FrameRenderer, IncrementalRenderer
+            renderer_class = IncrementalRenderer if self.renderer_type == 'incremental' else FrameRenderer
+            self.renderer = renderer_class(**self.renderer_options)
+        cars, pedestrians = snapshot.cars, snapshot.pedestrians
+        if self.level_of_detail is not None and self.level_of_detail.select(len(cars) + len(pedestrians)) != SPRITES:
+            cars, pedestrians = (), ()
+        frame = self.renderer.render(*snapshot.light_state, cars = cars, pedestrians = pedestrians)
+        return snapshot, frame.copy()
+
+class ConsumerFailure():
+    '''
+    result of a consumer that raised an exception, exceptions may not be picklable so only the traceback is sent
+    '''
+    def __init__(self, traceback_text):
+        self.traceback_text = traceback_text
+
+def consume(consumer, inputs, outputs):
+    '''
+    consumer loop of a thread or a process, applies consumer to every item of inputs until it gets None and keeps
+    only the latest results in outputs; if consumer raises, a ConsumerFailure is put into outputs and the loop ends
+    '''
+    while True:
+        item = inputs.get()
+        if item is None:
+            break
+        try:
+            result = consumer(item)
+        except Exception:
+            put_latest(outputs, ConsumerFailure(traceback.format_exc()))
+            break
+        put_latest(outputs, result)
+
+def put_latest(outputs, result):
+    '''
+    puts result into outputs, making room by discarding the oldest results
+    '''
+    while True:
+        try:
+            outputs.put_nowait(result)
+            return
+        except queue.Full:
+            try:
+                outputs.get_nowait()
+            except queue.Empty:
+                pass
+
+class Pipeline():
+    '''
+    Pipeline Class
+
+    Bounded producer/consumer queue around a consumer callable. put() hands a snapshot to the consumer following the
+    policy of the pipeline, get_latest() returns the most recent result or None if there is no new one. With
+    use_process = True the consumer runs in a separate process and must be picklable. A blocked put() and close()
+    check every poll_interval seconds that the consumer is still running.
+
+    '''
+    def __init__(self, consumer, queue_size=2, policy='block', use_process=False, num_results=2, poll_interval=0.5):
+        if policy not in policies:
+            raise ValueError('policy must be one of {}'.format(policies))
+        self.policy = policy
+        self.poll_interval = poll_interval
+        self.num_produced = 0
+        self.num_dropped = 0
+        self.num_consumed = 0
+        self.closed = False
+        if use_process:
+            self.inputs = multiprocessing.Queue(queue_size)
+            self.outputs = multiprocessing.Queue(num_results)
+            self.worker = multiprocessing.Process(target = consume, args = (consumer, self.inputs, self.outputs),
+                    daemon = True)
+        else:
+            self.inputs = queue.Queue(queue_size)
+            self.outputs = queue.Queue(num_results)
+            self.worker = threading.Thread(target = consume, args = (consumer, self.inputs, self.outputs),
+                    daemon = True)
+        self.worker.start()
+
+    def check_worker(self):
+        '''
+        raises a RuntimeError, with the traceback of the consumer if it failed, if the consumer is no longer running
+        '''
+        if self.worker.is_alive():
+            return
+        # the results left behind are of no use any more, look for the failure among them
+        try:
+            while True:
+                result = self.outputs.get(timeout = 0.05)
+                if isinstance(result, ConsumerFailure):
+                    raise RuntimeError('the consumer of the pipeline failed:\n{}'.format(result.traceback_text))
+        except queue.Empty:
+            pass
+        exitcode = getattr(self.worker, 'exitcode', None)
+        raise RuntimeError('the consumer of the pipeline stopped{}'.format(
+            '' if exitcode is None else ' with exit code {}'.format(exitcode)))
+
+    def put_blocking(self, item, timeout=None):
+        '''
+        puts item into the input queue, waiting while it is full; raises queue.Full after timeout seconds (if given)
+        and a RuntimeError if the consumer stops meanwhile
+        '''
+        start_time = time.time()
+        while True:
+            wait = self.poll_interval
+            if timeout is not None:
+                wait = min(wait, max(timeout - (time.time() - start_time), 0))
+            try:
+                self.inputs.put(item, timeout = wait)
+                return
+            except queue.Full:
+                self.check_worker()
+                if timeout is not None and time.time() - start_time >= timeout:
+                    raise
+
+    def put(self, item, timeout=None):
+        '''
+        hands item to the consumer, returns False if the item (or, with 'drop_oldest', an older one) was dropped;
+        raises a RuntimeError if the consumer stopped
+        '''
+        self.check_worker()
+        if self.policy == 'block':
+            self.put_blocking(item, timeout)
+            self.num_produced += 1
+            return True
+        self.num_produced += 1
+        try:
+            self.inputs.put_nowait(item)
+            return True
+        except queue.Full:
+            self.num_dropped += 1
+            if self.policy == 'drop_newest':
+                return False
+        put_latest(self.inputs, item)
+        return False
+
+    def get_latest(self, timeout=None):
+        '''
+        returns the most recent result, None if there is no new result (within timeout seconds if given); raises a
+        RuntimeError if the consumer failed or stopped
+        '''
+        result = None
+        try:
+            result = self.outputs.get(timeout = timeout) if timeout is not None else self.outputs.get_nowait()
+            while not isinstance(result, ConsumerFailure):
+                result = self.outputs.get_nowait()
+        except queue.Empty:
+            pass
+        if isinstance(result, ConsumerFailure):
+            raise RuntimeError('the consumer of the pipeline failed:\n{}'.format(result.traceback_text))
+        if result is None and not self.closed:
+            self.check_worker()
+        if result is not None:
+            self.num_consumed += 1
+        return result
+
+    def close(self, timeout=None):
+        '''
+        lets the consumer finish the queued items and stops it, results that were not fetched are discarded; after
+        timeout seconds (if given) a consumer process is terminated and a consumer thread is left behind
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        start_time = time.time()
+        try:
+            if self.policy == 'block':
+                self.put_blocking(None, timeout)
+            else:
+                put_latest(self.inputs, None)
+        except (RuntimeError, queue.Full): # the consumer stopped or is stuck, there is nobody to tell
+            pass
+        # a consumer process only exits once its results have left the pipe
+        while self.worker.is_alive() and (timeout is None or time.time() - start_time < timeout):
+            try:
+                self.outputs.get(timeout = 0.05)
+            except queue.Empty:
+                pass
+        if not self.worker.is_alive():
+            self.worker.join()
+        elif isinstance(self.worker, multiprocessing.Process):
+            self.worker.terminate()
+            self.worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+class SimulationProducer():
+    '''
+    SimulationProducer Class
+
+    Thread that steps a simulator num_steps times (forever if None) and puts the snapshot of every step into a
+    pipeline. With a 'block' pipeline the simulation is throttled to the speed of the consumer.
+
+    '''
+    def __init__(self, simulator, pipeline, num_steps=None, dt=None):
+        self.simulator = simulator
+        self.pipeline = pipeline
+        self.num_steps = num_steps
+        self.dt = dt
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def run(self):
+        step = 0
+        self.pipeline.put(take_snapshot(self.simulator))
+        while not self.stop_event.is_set() and (self.num_steps is None or step < self.num_steps):
+            self.simulator.step(self.dt)
+            snapshot = take_snapshot(self.simulator)
+            # wake up regularly to notice a stop request while the pipeline is full
+            while not self.stop_event.is_set():
+                try:
+                    self.pipeline.put(snapshot, timeout = 0.1)
+                    break
+                except queue.Full:
+                    pass
+            step += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -0,0 +1,116 @@
+# Remote Viewer
+#
+# Shows a simulation published by rendering/broadcast.py in a matplotlib window. A receiver thread reads the messages
+# and keeps the latest snapshot, the animation renders it whenever there is a new one. Run from the
+# traffic_intersection folder, e.g.
+#     python -m rendering.remote_viewer --port 8765 --rate 10
+
+import socket
+import threading
+from rendering.broadcast import decode_snapshot, length
+
+def connect(host='127.0.0.1', port=8765, path=None, rate=None):
+    '''
+    connects to a broadcast server and asks for at most rate messages per second
+    '''
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+    else:
+        connection = socket.create_connection((host, port))
+    if rate is not None:
+        connection.sendall('rate {}\n'.format(rate).encode())
+    return connection
+
+def receive_exactly(connection, num_bytes):
+    data = bytearray()
+    while len(data) < num_bytes:
+        chunk = connection.recv(num_bytes - len(data))
+        if len(chunk) == 0:
+            raise ConnectionError('the server closed the connection')
+        data += chunk
+    return bytes(data)
+
+def receive_snapshots(connection):
+    '''
+    yields the snapshots sent over connection until the server hangs up
+    '''
+    try:
+        while True:
+            num_bytes, = length.unpack(receive_exactly(connection, length.size))
+            yield decode_snapshot(receive_exactly(connection, num_bytes))
+    except ConnectionError:
+        return
+
+class SnapshotReceiver():
+    '''
+    Snapshot Receiver Class
+
+    Thread that reads snapshots from a connection and keeps the latest one. get_latest() returns it once, then None
+    until a newer snapshot arrives.
+
+    '''
+    def __init__(self, connection):
+        self.connection = connection
+        self.latest = None
+        self.num_received = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+    def run(self):
+        for snapshot in receive_snapshots(self.connection):
+            with self.lock:
+                self.latest = snapshot
+                self.num_received += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def is_connected(self):
+        return self.thread.is_alive()
+
+    def get_latest(self):
+        with self.lock:
+            snapshot, self.latest = self.latest, None
+        return snapshot
+
+    def close(self):
+        self.connection.close()
+
+if __name__ == '__main__':
+    import argparse
+    import matplotlib.animation as animation
+    import matplotlib.pyplot as plt
+    from rendering.level_of_detail import LevelOfDetail, SPRITES
+    from rendering.live_view import LiveView
+    from rendering.renderer import IncrementalRenderer
+    parser = argparse.ArgumentParser(description='Show a simulation published by rendering.broadcast')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help='path of the Unix socket of the server')
+    parser.add_argument('--rate', type=float, default=10., help='frames per second')
+    args = parser.parse_args()
+    receiver = SnapshotReceiver(connect(args.host, args.port, args.unix, args.rate)).start()
+    renderer = IncrementalRenderer()
+    level_of_detail = LevelOfDetail()
+    fig = plt.figure()
+    ax = fig.add_axes([0,0,1,1])
+    plt.axis('off')
+    live_view = LiveView(ax, *renderer.backgrounds.size)
+
+    def animate(frame_idx):
+        snapshot = receiver.get_latest()
+        if snapshot is None:
+            return live_view.artists
+        level = level_of_detail.select(len(snapshot.cars) + len(snapshot.pedestrians))
+        if level == SPRITES:
+            frame = renderer.render(*snapshot.light_state, cars = snapshot.cars, pedestrians = snapshot.pedestrians)
+        else:
+            frame = renderer.render(*snapshot.light_state)
+        return live_view.update(frame, cars = snapshot.cars, colliding = snapshot.colliding,
+                wavefronts = snapshot.wavefronts, pedestrians = snapshot.pedestrians, level = level)
+
+    ani = animation.FuncAnimation(fig, animate, interval = 1000. / args.rate, blit = True, cache_frame_data = False)
+    plt.show()
+    receiver.close()
@@ -0,0 +1,319 @@
+# Array Renderer
+#
+# Renders frames into a numpy uint8 RGBA array instead of pasting every sprite onto a PIL image. Every sprite (one
+# heading bin of an atlas) is split once into a stencil: its opaque pixels, which are copied, and its translucent edge
+# pixels, which are alpha-blended. All sprites of a layer that do not overlap are then drawn together with one scatter
+# into the flattened frame. The frame lives inside a buffer padded by a margin on every side so that sprites crossing
+# the image border need no clipping in the batched path. The frame can be handed to a video writer or to
+# AxesImage.set_data as it is.
+
+from collections import Counter
+import numpy as np
+import scipy.ndimage
+import rendering.sprite_atlas as sprite_atlas
+from rendering.backgrounds import get_backgrounds
+
+def divide_by_255(values):
+    '''
+    returns round(values / 255) for uint16 values up to 255 * 255 without a division
+    '''
+    values = values + 128
+    return (values + (values >> 8)) >> 8
+
+def blend(destination, sprite, inverse_alpha=None):
+    '''
+    returns the premultiplied RGBA sprite composited over destination, both uint8 arrays of broadcastable shapes
+    '''
+    if inverse_alpha is None:
+        inverse_alpha = 255 - sprite[..., 3:4].astype(np.uint16)
+    return sprite + divide_by_255(destination.astype(np.uint16) * inverse_alpha).astype(np.uint8)
+
+def first_non_overlapping(xs, ys, widths, heights):
+    '''
+    returns a boolean mask of the rectangles (xs, ys, widths, heights) that do not overlap any rectangle before them
+    '''
+    overlap = ((xs[:, None] < xs[None, :] + widths[None, :]) & (xs[None, :] < xs[:, None] + widths[:, None]) &
+            (ys[:, None] < ys[None, :] + heights[None, :]) & (ys[None, :] < ys[:, None] + heights[:, None]))
+    return ~np.tril(overlap, -1).any(axis = 1)
+
+def make_stencil(sprite, row_stride):
+    '''
+    splits a premultiplied RGBA sprite into the flat buffer offsets and packed values of its opaque pixels and the
+    offsets, values and inverse alphas of its translucent pixels, for a buffer with row_stride pixels per row
+    '''
+    alpha = sprite[..., 3]
+    rows, cols = np.nonzero(alpha == 255)
+    opaque_offsets = rows * row_stride + cols
+    opaque_pixels = np.ascontiguousarray(sprite[rows, cols]).view(np.uint32)[:, 0]
+    rows, cols = np.nonzero((alpha > 0) & (alpha < 255))
+    partial_offsets = rows * row_stride + cols
+    partial_pixels = sprite[rows, cols]
+    partial_inverse_alpha = 255 - partial_pixels[:, 3:4].astype(np.uint16)
+    return opaque_offsets, opaque_pixels, partial_offsets, partial_pixels, partial_inverse_alpha
+
+class FrameRenderer():
+    '''
+    Frame Renderer Class
+
+    Call begin() with the light colors at the start of every frame, then draw_pedestrians() and draw_cars(), then
+    read frame (a view that is overwritten by the next frame). The agents of one draw call are split into rounds of
+    sprites that do not overlap any earlier sprite of the call, every round is drawn at once, so the result is the
+    same as drawing the agents one by one in order.
+
+    '''
+    def __init__(self, backgrounds=None, num_headings=sprite_atlas.default_num_headings, antialias=False, margin=100):
+        if backgrounds is None:
+            backgrounds = get_backgrounds()
+        self.backgrounds = backgrounds
+        self.num_headings = num_headings
+        self.antialias = antialias
+        self.width, self.height = backgrounds.size
+        self.margin = margin # sprites at most this large never need clipping
+        self.buffer = np.zeros((self.height + 2 * margin, self.width + 2 * margin, 4), dtype=np.uint8)
+        self.frame = self.buffer[margin:margin + self.height, margin:margin + self.width]
+        # flat view of the buffer with one uint32 per pixel
+        self.packed_buffer = self.buffer.view(np.uint32).reshape(-1)
+        self.stencils = dict() # (atlas, heading bin) -> stencil, see make_stencil
+        self.light_state = None
+        self.sprites_drawn = 0
+
+    def begin(self, horizontal_light, vertical_light):
+        '''
+        starts a new frame by restoring the background of the light state
+        '''
+        self.light_state = (horizontal_light, vertical_light)
+        self.frame[...] = self.backgrounds.get_array(horizontal_light, vertical_light)
+        self.sprites_drawn = 0
+
+    def get_rgb(self):
+        return self.frame[..., 0:3]
+
+    def get_stencil(self, atlas, heading_bin):
+        key = (atlas, heading_bin)
+        if key not in self.stencils:
+            self.stencils[key] = make_stencil(atlas.premultiplied[heading_bin], self.buffer.shape[1])
+        return self.stencils[key]
+
+    def blit_clipped(self, sprite, x, y, bounds=None):
+        '''
+        blends one premultiplied sprite with its lower left corner at buffer coordinates (x, y), clipped to the buffer
+        or to the buffer rectangle bounds = (x_min, y_min, x_max, y_max)
+        '''
+        if bounds is None:
+            bounds = (0, 0, self.buffer.shape[1], self.buffer.shape[0])
+        height, width = sprite.shape[0:2]
+        x_min, y_min = max(x, bounds[0]), max(y, bounds[1])
+        x_max = min(x + width, bounds[2])
+        y_max = min(y + height, bounds[3])
+        if x_min >= x_max or y_min >= y_max:
+            return
+        region = self.buffer[y_min:y_max, x_min:x_max]
+        region[...] = blend(region, sprite[y_min - y:y_max - y, x_min - x:x_max - x])
+
+    def draw_round(self, stencils, bases):
+        '''
+        draws non-overlapping stencils at the flat buffer offsets bases at once
+        '''
+        self.packed_buffer[np.concatenate([stencil[0] + base for stencil, base in zip(stencils, bases)])] = \
+                np.concatenate([stencil[1] for stencil in stencils])
+        partial = [(stencil, base) for stencil, base in zip(stencils, bases) if len(stencil[2]) > 0]
+        if len(partial) > 0:
+            index = np.concatenate([stencil[2] + base for stencil, base in partial])
+            # gather and scatter whole pixels as uint32, blend them as channels
+            destination = self.packed_buffer[index].view(np.uint8).reshape(-1, 4)
+            blended = blend(destination, np.concatenate([stencil[3] for stencil, _ in partial]),
+                    np.concatenate([stencil[4] for stencil, _ in partial]))
+            self.packed_buffer[index] = blended.view(np.uint32)[:, 0]
+
+    def draw_sprites(self, sprites):
+        '''
+        draws a list of (atlas, heading bin, x corner, y corner) in order, corners are frame coordinates
+        '''
+        if len(sprites) == 0:
+            return
+        xs = np.array([sprite[2] for sprite in sprites], dtype=int) + self.margin
+        ys = np.array([sprite[3] for sprite in sprites], dtype=int) + self.margin
+        heights = np.array([atlas.sprites.shape[1] for atlas, _, _, _ in sprites])
+        widths = np.array([atlas.sprites.shape[2] for atlas, _, _, _ in sprites])
+        # cull the sprites outside of the frame, clip the ones that stick out of the buffer
+        visible = ((xs + widths > self.margin) & (xs < self.margin + self.width) &
+                (ys + heights > self.margin) & (ys < self.margin + self.height))
+        inside = (xs >= 0) & (ys >= 0) & (xs + widths <= self.buffer.shape[1]) & (ys + heights <= self.buffer.shape[0])
+        self.sprites_drawn += int(np.sum(visible))
+        remaining = np.nonzero(visible)[0]
+        while len(remaining) > 0:
+            in_round = first_non_overlapping(xs[remaining], ys[remaining], widths[remaining], heights[remaining])
+            stencils = []
+            bases = []
+            for k in remaining[in_round]:
+                atlas, heading_bin = sprites[k][0:2]
+                if inside[k]:
+                    stencils.append(self.get_stencil(atlas, heading_bin))
+                    bases.append(ys[k] * self.buffer.shape[1] + xs[k])
+                else:
+                    self.blit_clipped(atlas.premultiplied[heading_bin], xs[k], ys[k])
+            if len(stencils) > 0:
+                self.draw_round(stencils, bases)
+            remaining = remaining[~in_round]
+
+    def place(self, atlas, x, y, theta):
+        '''
+        returns the (atlas, heading bin, x corner, y corner) of an agent at (x, y) with heading theta
+        '''
+        heading_bin = atlas.heading_bin(theta)
+        return (atlas, heading_bin) + atlas.get_corner(heading_bin, x, y)
+
+    def get_car_sprites(self, cars):
+        '''
+        returns the sprites of the cars, anything with a state (v, theta, x, y) and a color
+        '''
+        sprites = []
+        for car in cars:
+            vee, theta, x, y = np.ravel(car.state)[0:4]
+            atlas = sprite_atlas.get_car_atlas(car.color, num_headings = self.num_headings, antialias = self.antialias)
+            sprites.append(self.place(atlas, x, y, theta))
+        return sprites
+
+    def get_pedestrian_sprites(self, pedestrians):
+        '''
+        returns the sprites of the pedestrians, anything with a state (x, y, theta, gait), a pedestrian_type and a
+        film_dim
+        '''
+        sprites = []
+        for pedestrian in pedestrians:
+            x, y, theta, gait = pedestrian.state
+            atlases = sprite_atlas.get_pedestrian_atlases(pedestrian.pedestrian_type, pedestrian.film_dim,
+                    self.num_headings)
+            sprites.append(self.place(atlases[int(gait) % len(atlases)], x, y, theta))
+        return sprites
+
+    def draw_cars(self, cars):
+        self.draw_sprites(self.get_car_sprites(cars))
+
+    def draw_pedestrians(self, pedestrians):
+        self.draw_sprites(self.get_pedestrian_sprites(pedestrians))
+
+    def render(self, horizontal_light, vertical_light, cars=(), pedestrians=()):
+        '''
+        draws a whole frame, pedestrians below cars, and returns it
+        '''
+        self.begin(horizontal_light, vertical_light)
+        self.draw_pedestrians(pedestrians)
+        self.draw_cars(cars)
+        return self.frame
+
+def get_changed_rectangles(array_1, array_2):
+    '''
+    returns the bounding rectangles (x_min, y_min, x_max, y_max) of the connected regions where two images differ
+    '''
+    labels, _ = scipy.ndimage.label((array_1 != array_2).any(axis = 2))
+    return [(cols.start, rows.start, cols.stop, rows.stop) for rows, cols in scipy.ndimage.find_objects(labels)]
+
+def merge_rectangles(rectangles):
+    '''
+    replaces overlapping rectangles (x_min, y_min, x_max, y_max) by their bounding rectangle until none overlap
+    '''
+    merged = []
+    for rectangle in rectangles:
+        x_min, y_min, x_max, y_max = rectangle
+        if x_min >= x_max or y_min >= y_max:
+            continue
+        overlapping = True
+        while overlapping:
+            overlapping = False
+            for other in merged:
+                if x_min < other[2] and other[0] < x_max and y_min < other[3] and other[1] < y_max:
+                    merged.remove(other)
+                    x_min, y_min = min(x_min, other[0]), min(y_min, other[1])
+                    x_max, y_max = max(x_max, other[2]), max(y_max, other[3])
+                    overlapping = True
+                    break
+        merged.append((x_min, y_min, x_max, y_max))
+    return merged
+
+class IncrementalRenderer(FrameRenderer):
+    '''
+    Incremental Renderer Class
+
+    Keeps the last frame and only repaints what changed: the rectangles of the sprites that appeared or disappeared
+    since the last frame (a moving agent shows up as both) and the regions where the backgrounds of the old and the
+    new light state differ. Every dirty rectangle is restored from the background and the sprites that intersect it
+    are redrawn clipped to it, so the frame is the same as a full render. If the dirty area exceeds
+    full_redraw_fraction of the frame, the whole frame is rendered instead. Frame cost is proportional to motion.
+
+    '''
+    def __init__(self, backgrounds=None, num_headings=sprite_atlas.default_num_headings, antialias=False, margin=100,
+            full_redraw_fraction=0.5):
+        FrameRenderer.__init__(self, backgrounds, num_headings, antialias, margin)
+        self.full_redraw_fraction = full_redraw_fraction
+        self.previous_sprites = None
+        self.background_changes = dict() # (light state, light state) -> changed rectangles
+        self.dirty_rectangles = [] # frame rectangles repainted by the last render, None after a full render
+
+    def reset(self):
+        '''
+        forces a full render at the next frame
+        '''
+        self.previous_sprites = None
+
+    def get_background_changes(self, light_state_1, light_state_2):
+        key = (light_state_1, light_state_2)
+        if key not in self.background_changes:
+            self.background_changes[key] = get_changed_rectangles(self.backgrounds.get_array(*light_state_1),
+                    self.backgrounds.get_array(*light_state_2))
+        return self.background_changes[key]
+
+    def get_rectangle(self, sprite):
+        '''
+        returns the frame rectangle covered by a sprite, clipped to the frame
+        '''
+        atlas, heading_bin, x, y = sprite
+        height, width = atlas.sprites.shape[1:3]
+        return (max(x, 0), max(y, 0), min(x + width, self.width), min(y + height, self.height))
+
+    def repaint(self, rectangle, sprites, xs, ys, x_maxs, y_maxs):
+        '''
+        restores the frame rectangle from the background and redraws the sprites that intersect it in order
+        '''
+        x_min, y_min, x_max, y_max = rectangle
+        if x_min >= x_max or y_min >= y_max:
+            return
+        self.frame[y_min:y_max, x_min:x_max] = self.backgrounds.get_array(*self.light_state)[y_min:y_max, x_min:x_max]
+        bounds = (x_min + self.margin, y_min + self.margin, x_max + self.margin, y_max + self.margin)
+        for k in np.nonzero((xs < x_max) & (x_maxs > x_min) & (ys < y_max) & (y_maxs > y_min))[0]:
+            atlas, heading_bin, x, y = sprites[k]
+            self.blit_clipped(atlas.premultiplied[heading_bin], x + self.margin, y + self.margin, bounds)
+
+    def render(self, horizontal_light, vertical_light, cars=(), pedestrians=()):
+        '''
+        brings the frame up to date, pedestrians below cars, and returns it
+        '''
+        light_state = (horizontal_light, vertical_light)
+        sprites = self.get_pedestrian_sprites(pedestrians) + self.get_car_sprites(cars)
+        if self.previous_sprites is None:
+            rectangles = None
+        else:
+            previous = Counter(self.previous_sprites)
+            current = Counter(sprites)
+            rectangles = [self.get_rectangle(sprite) for sprite in ((previous - current) + (current - previous)).elements()]
+            if light_state != self.light_state:
+                rectangles += self.get_background_changes(self.light_state, light_state)
+            # the old and the new rectangle of a moving agent mostly overlap, repaint them once
+            rectangles = merge_rectangles(rectangles)
+            area = sum([max(x_max - x_min, 0) * max(y_max - y_min, 0) for x_min, y_min, x_max, y_max in rectangles])
+            if area > self.full_redraw_fraction * self.width * self.height:
+                rectangles = None
+        if rectangles is None:
+            self.begin(horizontal_light, vertical_light)
+            self.draw_sprites(sprites)
+        else:
+            self.light_state = light_state
+            xs = np.array([sprite[2] for sprite in sprites], dtype=int)
+            ys = np.array([sprite[3] for sprite in sprites], dtype=int)
+            x_maxs = xs + np.array([sprite[0].sprites.shape[2] for sprite in sprites], dtype=int)
+            y_maxs = ys + np.array([sprite[0].sprites.shape[1] for sprite in sprites], dtype=int)
+            for rectangle in rectangles:
+                self.repaint(rectangle, sprites, xs, ys, x_maxs, y_maxs)
+        self.previous_sprites = sprites
+        self.dirty_rectangles = rectangles
+        return self.frame
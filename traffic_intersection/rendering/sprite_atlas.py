@@ -0,0 +1,218 @@
+# Sprite Atlas
+#
+# Rotating and rescaling the full size car image for every car at every frame dominates the rendering time. An atlas
+# holds the image already rotated to a fixed number of quantized headings and rescaled, together with the offset from
+# the reference point of the agent (e.g. the center of the rear axle) to the lower left corner of each sprite, so that
+# drawing an agent is a table lookup followed by a paste.
+
+import hashlib
+import json
+import os
+import numpy as np
+from PIL import Image
+import assumes.params as params
+import components.sprite_cache as sprite_cache
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+cache_dir = dir_path + '/cache'
+default_num_headings = 360
+
+class SpriteAtlas():
+    '''
+    Sprite Atlas Class
+
+    sprites[k] is the RGBA image rotated to the heading 2*pi*k/num_headings and offsets[k] is the offset from the
+    reference point to the lower left corner of sprites[k]. The images (for PIL) and the premultiplied arrays (for
+    numpy renderers) are created once and shared. parameters are the arguments of build_atlas the atlas was built
+    with, they are saved with the atlas so that a cached atlas can be checked against them.
+
+    '''
+    def __init__(self, sprites, offsets, parameters=None):
+        self.sprites = np.ascontiguousarray(sprites, dtype=np.uint8)
+        self.offsets = np.asarray(offsets, dtype=float)
+        self.parameters = parameters
+        self.num_headings = len(self.sprites)
+        self.sprites.flags.writeable = False
+        self.images = [Image.fromarray(sprite, 'RGBA') for sprite in self.sprites]
+        self._premultiplied = None
+
+    @property
+    def premultiplied(self):
+        if self._premultiplied is None:
+            self._premultiplied = sprite_cache.premultiply(self.sprites)
+            self._premultiplied.flags.writeable = False
+        return self._premultiplied
+
+    def heading_bin(self, theta):
+        '''
+        returns the index of the sprite closest to heading theta
+        '''
+        return int(round(float(theta) / (2 * np.pi) * self.num_headings)) % self.num_headings
+
+    def get_corner(self, heading_bin, x, y):
+        '''
+        returns the pixel coordinates of the lower left corner of the sprite when the reference point is at (x, y)
+        '''
+        x_offset, y_offset = self.offsets[heading_bin]
+        return int(float(x) + x_offset), int(float(y) + y_offset)
+
+    def get(self, x, y, theta):
+        '''
+        returns the PIL image and the lower left corner for an agent at (x, y) with heading theta
+        '''
+        k = self.heading_bin(theta)
+        return self.images[k], self.get_corner(k, x, y)
+
+    def save(self, file_name):
+        np.savez(file_name, sprites = self.sprites, offsets = self.offsets,
+                parameters = np.array(parameter_key(self.parameters)))
+
+    @classmethod
+    def load(cls, file_name):
+        with np.load(file_name) as data:
+            parameters = json.loads(str(data['parameters'])) if 'parameters' in data.files else None
+            return cls(data['sprites'], data['offsets'], parameters)
+
+def parameter_key(parameters):
+    '''
+    returns a canonical JSON string of the parameters of an atlas, equal for equal parameters
+    '''
+    return json.dumps(parameters, sort_keys=True)
+
+def parameter_hash(parameters):
+    return hashlib.sha1(parameter_key(parameters).encode()).hexdigest()[0:12]
+
+def corner_offset(pivot, theta, width, height):
+    '''
+    returns the offset from the point pivot (given relative to the image center when the heading is 0) to the lower
+    left corner of a width x height image rotated to heading theta
+    '''
+    x_pivot, y_pivot = pivot
+    x_after = np.cos(theta) * x_pivot - np.sin(theta) * y_pivot
+    y_after = np.sin(theta) * x_pivot + np.cos(theta) * y_pivot
+    return -x_after - width / 2., -y_after - height / 2.
+
+def build_atlas(image, num_headings=default_num_headings, scale=1., pivot=(0., 0.), angle_offset=0., antialias=False):
+    '''
+    rotates a square image to num_headings headings and rescales it
+    input:  image - PIL image at heading 0
+            scale - scale factor applied after the rotation
+            pivot - reference point relative to the center of the scaled image at heading 0
+            angle_offset - angle in degrees added to the counter-clockwise rotation, for images not drawn facing east
+            antialias - resample with a Lanczos filter when rescaling
+    output: SpriteAtlas
+    '''
+    width, height = image.size
+    size = (int(scale * width), int(scale * height))
+    sprites = np.empty((num_headings, size[1], size[0], 4), dtype=np.uint8)
+    offsets = np.empty((num_headings, 2))
+    for k in range(num_headings):
+        theta = 2 * np.pi * k / num_headings
+        # the image is displayed with origin="lower", so a clockwise rotation of the image is counter-clockwise on screen
+        sprite = image.rotate(angle_offset - theta / np.pi * 180, expand = False)
+        if size != (width, height):
+            if antialias:
+                sprite = sprite.resize(size, Image.LANCZOS)
+            else:
+                sprite = sprite.resize(size)
+        sprites[k] = np.asarray(sprite.convert('RGBA'))
+        offsets[k] = corner_offset(pivot, theta, size[0], size[1])
+    parameters = {'num_headings': num_headings, 'scale': scale, 'pivot': list(pivot), 'angle_offset': angle_offset,
+            'antialias': antialias}
+    return SpriteAtlas(sprites, offsets, parameters)
+
+def load_or_build(file_name, source_file, builder, parameters=None):
+    '''
+    loads the atlas cached in file_name unless it is missing, older than source_file or was built with other
+    parameters than the given ones, else builds it with builder() and tries to cache it
+    '''
+    if file_name is not None and os.path.exists(file_name) and os.path.getmtime(file_name) >= os.path.getmtime(source_file):
+        try:
+            atlas = SpriteAtlas.load(file_name)
+            if parameters is None or parameter_key(atlas.parameters) == parameter_key(parameters):
+                return atlas
+        except (IOError, ValueError, KeyError): # corrupt cache, rebuild it
+            pass
+    atlas = builder()
+    if file_name is not None:
+        try:
+            if not os.path.exists(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            atlas.save(file_name)
+        except (IOError, OSError): # a read-only installation only loses the cache
+            pass
+    return atlas
+
+# process-wide atlases, keyed by color and all parameters of build_atlas
+_car_atlases = dict()
+
+def get_car_atlas(color, num_headings=default_num_headings, antialias=False, use_disk_cache=True):
+    '''
+    returns the shared atlas of the car of the given color, the reference point of each sprite is the center of the
+    rear axle
+    '''
+    parameters = {'num_headings': num_headings, 'scale': params.car_scale_factor,
+            'pivot': [-params.car_scale_factor * params.center_to_axle_dist, 0.], 'angle_offset': 0.,
+            'antialias': antialias}
+    key = (color, parameter_key(parameters))
+    if key not in _car_atlases:
+        file_name = None
+        if use_disk_cache:
+            # the file name covers every parameter, and load_or_build checks them against the ones saved in the file
+            file_name = cache_dir + '/car_{}_{}.npz'.format(color, parameter_hash(parameters))
+        builder = lambda: build_atlas(sprite_cache.get_image('car', color), **parameters)
+        _car_atlases[key] = load_or_build(file_name, sprite_cache.car_figs[color], builder, parameters)
+    return _car_atlases[key]
+
+def crop_film(film, film_dim, scale=1.):
+    '''
+    rescales a film strip of film_dim[0] rows and film_dim[1] columns and returns its frames in gait order
+    '''
+    film = film.resize(tuple([int(scale * size) for size in film.size]))
+    width, height = film.size
+    sub_width = width / film_dim[1]
+    sub_height = height / film_dim[0]
+    frames = []
+    for gait in range(film_dim[0] * film_dim[1]):
+        i = gait % film_dim[1]
+        j = gait // film_dim[1]
+        frames.append(film.crop((int(i * sub_width), int(j * sub_height), int((i + 1) * sub_width),
+            int((j + 1) * sub_height))))
+    return frames
+
+# process-wide pedestrian atlases, keyed by (pedestrian type, film_dim, num_headings)
+_pedestrian_atlases = dict()
+
+def get_pedestrian_atlases(pedestrian_type, film_dim=(1, 6), num_headings=default_num_headings):
+    '''
+    returns the shared list of atlases of a pedestrian type, one per gait, the reference point of each sprite is its
+    center, the sprite of (type, gait, heading bin) is get_pedestrian_atlases(type)[gait].images[heading bin]
+    '''
+    key = (pedestrian_type, tuple(film_dim), num_headings)
+    if key not in _pedestrian_atlases:
+        frames = crop_film(sprite_cache.get_image('pedestrian', pedestrian_type), film_dim,
+                scale = params.pedestrian_scale_factor)
+        # the film strip shows pedestrians walking downwards
+        _pedestrian_atlases[key] = [build_atlas(frame, num_headings = num_headings, angle_offset = 270.)
+                for frame in frames]
+    return _pedestrian_atlases[key]
+
+def draw_pedestrian(background, pedestrian, num_headings=default_num_headings):
+    '''
+    pastes the current gait of pedestrian onto the PIL image background and returns the lower left corner of the sprite
+    '''
+    x, y, theta, current_gait = pedestrian.state
+    atlases = get_pedestrian_atlases(pedestrian.pedestrian_type, pedestrian.film_dim, num_headings)
+    sprite, corner = atlases[int(current_gait) % len(atlases)].get(x, y, theta)
+    background.paste(sprite, corner, sprite)
+    return corner
+
+def draw_car(background, vehicle, num_headings=default_num_headings, antialias=False):
+    '''
+    pastes the sprite of vehicle onto the PIL image background and returns the lower left corner of the sprite
+    '''
+    vee, theta, x, y = vehicle.state
+    atlas = get_car_atlas(vehicle.color, num_headings = num_headings, antialias = antialias)
+    sprite, corner = atlas.get(x, y, theta)
+    background.paste(sprite, corner, sprite)
+    return corner
@@ -0,0 +1,106 @@
+# Offscreen Video Export
+#
+# Writes the frames of the array renderer straight into an ffmpeg pipe, without a matplotlib figure or a GUI backend.
+# Run from the traffic_intersection folder, e.g.
+#     python -m rendering.video --duration 600 --seed 0 --width 1280 --height 918 --output run.mp4
+
+import argparse
+import imageio
+import numpy as np
+from rendering.renderer import IncrementalRenderer
+
+class VideoExporter():
+    '''
+    Video Exporter Class
+
+    Renders the simulator into a video file with imageio's ffmpeg writer. resolution = (width, height) rescales the
+    frames inside ffmpeg, codec, quality (0 to 10), bitrate and pixelformat are passed on to the writer. An exporter
+    can be attached to a simulator as an observer, it then writes one frame after every step.
+
+    '''
+    def __init__(self, file_name, fps=10, codec='libx264', resolution=None, quality=None, bitrate=None,
+            pixelformat='yuv420p', renderer=None):
+        if renderer is None:
+            renderer = IncrementalRenderer()
+        self.renderer = renderer
+        self.file_name = file_name
+        options = {'fps': fps, 'codec': codec, 'pixelformat': pixelformat, 'macro_block_size': 1}
+        if quality is not None:
+            options['quality'] = quality
+        if bitrate is not None:
+            options['bitrate'] = bitrate
+        if resolution is not None:
+            options['ffmpeg_params'] = ['-vf', 'scale={}:{}'.format(*resolution)]
+        self.writer = imageio.get_writer(file_name, format = 'FFMPEG', mode = 'I', **options)
+        self.frames_written = 0
+
+    def write(self, frame):
+        '''
+        appends an RGBA or RGB frame whose first row is the bottom of the image, like the frames of the renderers
+        '''
+        self.writer.append_data(np.ascontiguousarray(frame[::-1, :, 0:3]))
+        self.frames_written += 1
+
+    def write_simulator(self, simulator):
+        '''
+        renders and appends the current state of simulator
+        '''
+        traffic_lights = simulator.traffic_lights
+        frame = self.renderer.render(traffic_lights.get_states('horizontal', 'color'),
+                traffic_lights.get_states('vertical', 'color'), cars = list(simulator.cars.values()),
+                pedestrians = simulator.pedestrians)
+        self.write(frame)
+
+    def __call__(self, simulator): # observer interface
+        self.write_simulator(simulator)
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def export_simulation(simulator, file_name, num_steps, fps=None, **exporter_options):
+    '''
+    runs simulator for num_steps steps and writes every step as a frame of file_name, by default at real time speed
+    '''
+    if fps is None:
+        fps = 1. / simulator.dt
+    with VideoExporter(file_name, fps = fps, **exporter_options) as exporter:
+        exporter.write_simulator(simulator)
+        simulator.add_observer(exporter)
+        try:
+            simulator.run(num_steps)
+        finally:
+            simulator.remove_observer(exporter)
+    return exporter.frames_written
+
+if __name__ == '__main__':
+    import time
+    import prepare.primitive_graph as primitive_graph
+    from simulation.simulator import Simulator
+    parser = argparse.ArgumentParser(description='Render a headless simulation into a video file')
+    parser.add_argument('--duration', type=float, default=60., help='simulated seconds')
+    parser.add_argument('--dt', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--spawn-probability', type=float, default=1.)
+    parser.add_argument('--fps', type=float, default=None, help='frames per second, real time by default')
+    parser.add_argument('--codec', default='libx264')
+    parser.add_argument('--quality', type=float, default=None, help='0 (worst) to 10 (best)')
+    parser.add_argument('--bitrate', default=None)
+    parser.add_argument('--width', type=int, default=None, help='output width, needs --height')
+    parser.add_argument('--height', type=int, default=None, help='output height, needs --width')
+    parser.add_argument('--output', default='simulation.mp4')
+    args = parser.parse_args()
+    resolution = None
+    if args.width is not None and args.height is not None:
+        resolution = (args.width, args.height)
+    simulator = Simulator(primitive_graph.build_primitive_graph(), dt = args.dt, seed = args.seed,
+            spawn_probability = args.spawn_probability)
+    start_time = time.time()
+    frames = export_simulation(simulator, args.output, int(round(args.duration / args.dt)), fps = args.fps,
+            codec = args.codec, resolution = resolution, quality = args.quality, bitrate = args.bitrate)
+    print('wrote {} frames to {} in {:.1f} s'.format(frames, args.output, time.time() - start_time))
@@ -0,0 +1,200 @@
+# Multi-Intersection Corridor
+#
+# A corridor is a row of identical intersections. The eastbound sinks on the right edge of an intersection feed the
+# eastbound sources on the left edge of the next one and the westbound sinks on the left edge feed the westbound
+# sources on the right edge of the previous one. Every intersection is simulated by its own worker process, cars that
+# leave an intersection through such a boundary are handed to the neighbor at the next tick.
+
+import multiprocessing
+import queue
+import time
+import traceback
+import numpy as np
+import components.planner as planner
+import prepare.primitive_graph as primitive_graph
+from simulation.simulator import Simulator
+
+def same_heading(theta_1, theta_2, tolerance=0.1):
+    return np.cos(theta_1 - theta_2) > np.cos(tolerance)
+
+def boundary_map(frozen_graph, tile_width=1062):
+    '''
+    pairs the sinks on the left and right boundaries of an intersection with the sources of its neighbors
+    input:  frozen_graph - frozen primitive graph, a node is (v, theta, x, y)
+            tile_width - distance between two neighboring intersections
+    output: dictionary mapping each boundary sink to (offset, source node), where offset is +1 for the next
+            (eastern) and -1 for the previous (western) intersection
+    '''
+    sources = [frozen_graph.node(idx) for idx in frozen_graph.sources]
+    sinks = [frozen_graph.node(idx) for idx in frozen_graph.sinks]
+    mapping = dict()
+    for sink in sinks:
+        v, theta, x, y = [float(value) for value in sink] # some nodes are stored as unsigned integers
+        if same_heading(theta, 0) and x > tile_width / 2.:
+            offset = 1
+            candidates = [source for source in sources if same_heading(float(source[1]), 0) and source[2] < tile_width / 2.]
+        elif same_heading(theta, np.pi) and x < tile_width / 2.:
+            offset = -1
+            candidates = [source for source in sources if same_heading(float(source[1]), np.pi) and source[2] > tile_width / 2.]
+        else:
+            continue
+        if len(candidates) > 0:
+            # closest lane first, then closest speed
+            source = min(candidates, key = lambda source: (abs(float(source[3]) - y), abs(float(source[0]) - v)))
+            mapping[sink] = (offset, source)
+    return mapping
+
+def reachable_sinks(frozen_graph):
+    '''
+    returns a dictionary mapping every source to the list of sinks it has a path to
+    '''
+    reachable = dict()
+    for source_idx in frozen_graph.sources:
+        source = frozen_graph.node(source_idx)
+        reachable[source] = [frozen_graph.node(sink_idx) for sink_idx in frozen_graph.sinks
+                if len(planner.dijkstra(source, frozen_graph.node(sink_idx), frozen_graph)[1]) > 1]
+    return reachable
+
+class WorkerFailure():
+    '''
+    message of a worker that raised an exception, exceptions may not be picklable so only the traceback is sent
+    '''
+    def __init__(self, traceback_text):
+        self.traceback_text = traceback_text
+
+def intersection_worker(index, frozen_graph, spawn_sources, simulator_options, seed, inbox, outbox):
+    '''
+    simulates one intersection of the corridor, every message in inbox is the list of arriving cars
+    (license plate, source node, color) for the next tick, after the tick the cars that left through a boundary sink
+    are sent back as (index, [(license plate, sink node, color)]), a None message ends the worker which then sends
+    its metrics; if the simulation raises, (index, WorkerFailure) is sent and the worker ends
+    '''
+    try:
+        simulate_intersection(index, frozen_graph, spawn_sources, simulator_options, seed, inbox, outbox)
+    except Exception:
+        outbox.put((index, WorkerFailure(traceback.format_exc())))
+
+def simulate_intersection(index, frozen_graph, spawn_sources, simulator_options, seed, inbox, outbox):
+    simulator = Simulator(frozen_graph, seed = [seed, index], spawn_sources = spawn_sources, **simulator_options)
+    mapping = boundary_map(frozen_graph)
+    reachable = reachable_sinks(frozen_graph)
+    while True:
+        arrivals = inbox.get()
+        if arrivals is None:
+            break
+        for plate_number, source, color in arrivals:
+            if len(reachable[source]) > 0:
+                sinks = reachable[source]
+                sink = sinks[simulator.streams.spawner.integers(len(sinks))]
+                # cars that are already on the road cannot be turned away
+                simulator.request_car(source, sink, color = color, plate_number = plate_number, patience = float('inf'))
+        simulator.step()
+        departures = [(plate_number, sink, the_car.color) for plate_number, sink, the_car in simulator.exited
+                if sink in mapping]
+        outbox.put((index, departures))
+    outbox.put((index, simulator.metrics))
+
+class Corridor():
+    '''
+    Corridor Class
+
+    Runs num_intersections intersections side by side, each in its own process, and moves cars between neighbors
+    in lockstep at every tick. Cars only spawn at the sources on the two ends of the corridor and at the sources
+    that do not receive cars from a neighbor. simulator_options are passed on to every Simulator. If a worker raises
+    or dies, step() and close() raise a RuntimeError (with the traceback of the worker) instead of waiting forever;
+    with a timeout they also raise a TimeoutError when a worker takes longer than timeout seconds to answer.
+
+    '''
+    def __init__(self, num_intersections, seed=0, frozen_graph=None, timeout=None, poll_interval=0.5,
+                 **simulator_options):
+        if frozen_graph is None:
+            frozen_graph = primitive_graph.build_primitive_graph().freeze()
+        self.num_intersections = num_intersections
+        self.frozen_graph = frozen_graph
+        self.mapping = boundary_map(frozen_graph)
+        self.handoffs = 0 # number of cars moved between intersections
+        self.exits = 0 # number of cars that left the corridor on either end
+        self.metrics = None
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        context = multiprocessing.get_context()
+        self.inboxes = [context.Queue() for _ in range(num_intersections)]
+        self.outbox = context.Queue()
+        self.workers = []
+        for index in range(num_intersections):
+            # sources fed by a neighbor do not spawn cars
+            fed_sources = {source for offset, source in self.mapping.values()
+                    if 0 <= index - offset < num_intersections}
+            spawn_sources = [frozen_graph.node(idx) for idx in frozen_graph.sources
+                    if frozen_graph.node(idx) not in fed_sources]
+            worker = context.Process(target = intersection_worker, args = (index, frozen_graph, spawn_sources,
+                simulator_options, seed, self.inboxes[index], self.outbox))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        self.arrivals = [[] for _ in range(num_intersections)]
+
+    def step(self):
+        '''
+        advances every intersection by one tick and routes the cars that crossed a boundary
+        '''
+        for index in range(self.num_intersections):
+            self.inboxes[index].put(self.arrivals[index])
+        departures = self.receive_all()
+        # route in index order so that the arrival order does not depend on which worker finished first
+        self.arrivals = [[] for _ in range(self.num_intersections)]
+        for index in range(self.num_intersections):
+            for plate_number, sink, color in departures[index]:
+                offset, source = self.mapping[sink]
+                if 0 <= index + offset < self.num_intersections:
+                    self.arrivals[index + offset].append((plate_number, source, color))
+                    self.handoffs += 1
+                else:
+                    self.exits += 1
+
+    def run(self, num_steps):
+        for _ in range(num_steps):
+            self.step()
+
+    def close(self):
+        '''
+        stops the workers and returns the metrics of every intersection
+        '''
+        for inbox in self.inboxes:
+            inbox.put(None)
+        try:
+            metrics = self.receive_all()
+        finally:
+            for worker in self.workers:
+                if worker.is_alive():
+                    worker.join(self.poll_interval)
+                if worker.is_alive(): # it failed to stop
+                    worker.terminate()
+        self.metrics = metrics
+        return metrics
+
+    def receive_all(self):
+        '''
+        returns the answers of all workers to the last message, in index order
+        '''
+        answers = [None] * self.num_intersections
+        pending = set(range(self.num_intersections))
+        start_time = time.time()
+        while len(pending) > 0:
+            try:
+                index, answer = self.outbox.get(timeout = self.poll_interval)
+            except queue.Empty:
+                # a worker that died without a message, e.g. killed or out of memory
+                for index in sorted(pending):
+                    if not self.workers[index].is_alive():
+                        raise RuntimeError('intersection worker {} died with exit code {}'.format(index,
+                            self.workers[index].exitcode))
+                if self.timeout is not None and time.time() - start_time > self.timeout:
+                    raise TimeoutError('intersection workers {} did not answer within {} seconds'.format(
+                        sorted(pending), self.timeout))
+                continue
+            if isinstance(answer, WorkerFailure):
+                raise RuntimeError('intersection worker {} failed:\n{}'.format(index, answer.traceback_text))
+            answers[index] = answer
+            pending.discard(index)
+        return answers
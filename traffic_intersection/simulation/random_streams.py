@@ -0,0 +1,31 @@
+# Random Number Streams
+
+import numpy as np
+
+class RandomStreams():
+    '''
+    Random Streams Class
+
+    Derives independent numpy random generators from a single simulation seed with SeedSequence.spawn: one for the
+    car spawner, one for the traffic lights, one for honking, one per agent (used for the primitive disturbances of
+    that agent) and one for display choices such as which bounding boxes are shown, so that drawing never changes the
+    simulation. The n-th agent always gets the same stream, so a run is reproduced exactly by its seed regardless of
+    which process or machine runs it.
+
+    '''
+    def __init__(self, seed=None):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.seed = self.seed_sequence.entropy
+        # the n-th child of a seed sequence does not depend on how many children are spawned
+        spawner_seed, lights_seed, honking_seed, agent_seed, display_seed = self.seed_sequence.spawn(5)
+        self.spawner = np.random.default_rng(spawner_seed)
+        self.lights = np.random.default_rng(lights_seed)
+        self.honking = np.random.default_rng(honking_seed)
+        self._agent_seed = agent_seed
+        self.display = np.random.default_rng(display_seed)
+
+    def agent(self):
+        '''
+        returns the stream of the next agent
+        '''
+        return np.random.default_rng(self._agent_seed.spawn(1)[0])
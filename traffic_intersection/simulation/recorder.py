@@ -0,0 +1,365 @@
+# Trajectory Recorder
+#
+# A recording is a zip file in the .npz format that is only ever appended to. Ticks are buffered in preallocated
+# columnar chunks; every flush adds the arrays of one chunk as new members "<table>_<column>_<chunk>" and never
+# rewrites old ones, so a crashed run keeps everything up to the last flush. np.load opens a recording like any other
+# .npz; since members are stored uncompressed, Replay instead memory-maps each member at its offset in the zip file
+# (np.load ignores mmap_mode for .npz files), so seeking only reads the pages it touches. There are three tables:
+#     ticks       one row per recorded tick: time, frame index, light colors, and where its agents and collisions are
+#     agents      one row per agent per tick: id, kind, sprite code, state vector, current primitive and its progress
+#     collisions  one row per colliding pair per tick: the two agent ids
+
+import json
+import os
+import struct
+import zipfile
+from types import SimpleNamespace
+import numpy as np
+import components.sprite_cache as sprite_cache
+
+light_colors = ['green', 'yellow', 'red']
+car_colors = sorted(sprite_cache.car_figs)
+pedestrian_types = sorted(sprite_cache.pedestrian_figs)
+CAR, PEDESTRIAN = 0, 1 # agent kinds
+
+tick_columns = {'time': np.float64, 'frame_idx': np.int64, 'horizontal_light': np.int8, 'vertical_light': np.int8,
+        'agent_start': np.int64, 'num_agents': np.int32, 'collision_start': np.int64, 'num_collisions': np.int32}
+agent_columns = {'agent_id': np.int64, 'kind': np.int8, 'sprite': np.int8, 'state': (np.float64, 4),
+        'prim_id': np.int32, 'prim_progress': np.float64}
+collision_columns = {'agent_id_1': np.int64, 'agent_id_2': np.int64}
+tables = {'ticks': tick_columns, 'agents': agent_columns, 'collisions': collision_columns}
+
+def make_table(columns, capacity):
+    table = dict()
+    for name, dtype in columns.items():
+        if isinstance(dtype, tuple):
+            table[name] = np.zeros((capacity, dtype[1]), dtype=dtype[0])
+        else:
+            table[name] = np.zeros(capacity, dtype=dtype)
+    return table
+
+def write_member(archive, name, array):
+    with archive.open(name + '.npy', 'w', force_zip64 = True) as f:
+        np.lib.format.write_array(f, np.ascontiguousarray(array))
+
+def get_member_offsets(file_name):
+    '''
+    returns a dictionary that maps the names of the uncompressed members of a zip file (without '.npy') to the offsets
+    of their .npy data in the file
+    '''
+    offsets = dict()
+    with open(file_name, 'rb') as f:
+        with zipfile.ZipFile(f) as archive:
+            infos = archive.infolist()
+        for info in infos:
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith('.npy'):
+                continue
+            # the local header is 30 bytes followed by the file name and an extra field, both of variable length
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+            offsets[info.filename[:-4]] = info.header_offset + 30 + name_length + extra_length
+    return offsets
+
+def map_member(file_name, offset):
+    '''
+    returns a read-only memory map of the .npy data that starts at offset in file_name
+    '''
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        data_offset = f.tell()
+    if dtype.hasobject:
+        raise ValueError('cannot memory-map an array of Python objects')
+    if int(np.prod(shape)) == 0: # an empty array cannot be mapped
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(file_name, dtype = dtype, mode = 'r', offset = data_offset, shape = shape,
+            order = 'F' if fortran_order else 'C')
+
+def get_primitive(agent):
+    '''
+    returns (primitive id, progress) of the current primitive of an agent, the id is -1 if the primitive has none
+    (pedestrian primitives are waypoint pairs) and the progress is -1 if there is no primitive left
+    '''
+    if agent.prim_queue.len() == 0:
+        return -1, -1.
+    prim, prim_progress = agent.prim_queue.top()
+    if isinstance(prim, (int, np.integer)):
+        return int(prim), float(prim_progress)
+    return -1, float(prim_progress)
+
+class Recorder():
+    '''
+    Recorder Class
+
+    Records ticks of a simulator into file_name, either by calling record(simulator) or by adding the recorder as an
+    observer. Rows are kept in chunks of chunk_size agent rows (and as many ticks) and flushed to the file when a chunk
+    is full, on flush() and on close(). With append=True a recording is continued instead of replaced.
+
+    '''
+    def __init__(self, file_name, chunk_size=65536, metadata=None, append=False):
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+        self.num_chunks = 0
+        self.num_ticks = 0
+        if append and os.path.exists(file_name):
+            with zipfile.ZipFile(file_name) as archive:
+                names = [name for name in archive.namelist() if name.startswith('ticks_time_')]
+            self.num_chunks = len(names)
+        else:
+            meta = {'light_colors': light_colors, 'car_colors': car_colors, 'pedestrian_types': pedestrian_types}
+            meta.update(metadata or dict())
+            with zipfile.ZipFile(file_name, 'w', zipfile.ZIP_STORED, allowZip64 = True) as archive:
+                write_member(archive, 'metadata', np.array([json.dumps(meta)]))
+        self.new_chunk()
+
+    def new_chunk(self):
+        self.buffers = {name: make_table(columns, self.chunk_size) for name, columns in tables.items()}
+        self.sizes = {name: 0 for name in tables}
+
+    def reserve(self, table, rows):
+        '''
+        makes room for rows more rows in table, flushing the chunk first if needed; the rows of a tick always stay in
+        one chunk, so a table grows beyond chunk_size if a single tick needs it
+        '''
+        capacity = len(next(iter(self.buffers[table].values())))
+        if self.sizes[table] + rows > capacity:
+            if self.sizes['ticks'] > 0:
+                self.flush()
+            capacity = max(self.chunk_size, rows)
+            if capacity > self.chunk_size:
+                self.buffers[table] = make_table(tables[table], capacity)
+
+    def record(self, simulator):
+        '''
+        appends the current state of simulator as one tick
+        '''
+        agents = [(CAR, car_colors.index(car.color), car) for car in simulator.cars.values()]
+        agents += [(PEDESTRIAN, pedestrian_types.index(person.pedestrian_type), person)
+                for person in simulator.pedestrians]
+        collisions = simulator.collisions
+        self.reserve('ticks', 1)
+        self.reserve('agents', len(agents))
+        self.reserve('collisions', len(collisions))
+        rows = self.buffers['agents']
+        start = self.sizes['agents']
+        for row, (kind, sprite, agent) in enumerate(agents, start):
+            rows['agent_id'][row] = -1 if agent.agent_id is None else agent.agent_id
+            rows['kind'][row] = kind
+            rows['sprite'][row] = sprite
+            rows['state'][row] = np.ravel(agent.state)[0:4]
+            rows['prim_id'][row], rows['prim_progress'][row] = get_primitive(agent)
+        self.sizes['agents'] += len(agents)
+        pairs = self.buffers['collisions']
+        collision_start = self.sizes['collisions']
+        for row, (agent_1, agent_2) in enumerate(collisions, collision_start):
+            pairs['agent_id_1'][row] = agent_1.agent_id
+            pairs['agent_id_2'][row] = agent_2.agent_id
+        self.sizes['collisions'] += len(collisions)
+        ticks = self.buffers['ticks']
+        row = self.sizes['ticks']
+        traffic_lights = simulator.traffic_lights
+        ticks['time'][row] = simulator.time
+        ticks['frame_idx'][row] = simulator.frame_idx
+        ticks['horizontal_light'][row] = light_colors.index(traffic_lights.get_states('horizontal', 'color'))
+        ticks['vertical_light'][row] = light_colors.index(traffic_lights.get_states('vertical', 'color'))
+        ticks['agent_start'][row] = start
+        ticks['num_agents'][row] = len(agents)
+        ticks['collision_start'][row] = collision_start
+        ticks['num_collisions'][row] = len(collisions)
+        self.sizes['ticks'] += 1
+        self.num_ticks += 1
+
+    def __call__(self, simulator): # observer interface
+        self.record(simulator)
+
+    def flush(self):
+        '''
+        appends the buffered chunk to the file
+        '''
+        if self.sizes['ticks'] == 0:
+            return
+        with zipfile.ZipFile(self.file_name, 'a', zipfile.ZIP_STORED, allowZip64 = True) as archive:
+            for table, columns in self.buffers.items():
+                for column, values in columns.items():
+                    write_member(archive, '{}_{}_{:06d}'.format(table, column, self.num_chunks),
+                            values[0:self.sizes[table]])
+        self.num_chunks += 1
+        self.new_chunk()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+def record_simulation(simulator, file_name, num_steps, chunk_size=65536):
+    '''
+    runs simulator for num_steps steps and records the current tick and every step into file_name
+    '''
+    metadata = {'dt': simulator.dt, 'seed': simulator.seed}
+    with Recorder(file_name, chunk_size = chunk_size, metadata = metadata) as recorder:
+        recorder.record(simulator)
+        simulator.add_observer(recorder)
+        try:
+            simulator.run(num_steps)
+        finally:
+            simulator.remove_observer(recorder)
+    return recorder.num_ticks
+
+class Replay():
+    '''
+    Replay Class
+
+    Reads a recording. The tick table of the whole recording is loaded at once, the agent and collision rows are
+    opened one chunk at a time when a tick of the chunk is requested. With mmap=True the uncompressed members are
+    memory-mapped, so a chunk is not read into memory as a whole and only the rows of the requested ticks are paged
+    in; compressed members (and all members with mmap=False) are read through np.load, which is only opened for them.
+    seek(time) returns the index of the last tick at or before time, get_tick(index) the agents of a tick in the form
+    the renderers accept. close() (or leaving a with block) releases the file.
+
+    '''
+    def __init__(self, file_name, mmap=True):
+        self.file_name = file_name
+        self.archive = None # opened by get_member for members that are not memory-mapped
+        self.offsets = get_member_offsets(file_name) if mmap else dict()
+        with zipfile.ZipFile(file_name) as archive:
+            names = archive.namelist()
+        self.metadata = json.loads(str(self.get_member('metadata')[0]))
+        self.num_chunks = len([name for name in names if name.startswith('ticks_time_')])
+        ticks = {column: [] for column in tick_columns}
+        chunk_of_tick = []
+        for chunk in range(self.num_chunks):
+            for column in tick_columns:
+                ticks[column].append(self.get_member('ticks_{}_{:06d}'.format(column, chunk)))
+            chunk_of_tick.append(np.full(len(ticks['time'][-1]), chunk, dtype=np.int32))
+        self.ticks = {column: np.concatenate(values) if len(values) > 0 else np.zeros(0, dtype=tick_columns[column])
+                for column, values in ticks.items()}
+        self.chunk_of_tick = np.concatenate(chunk_of_tick) if len(chunk_of_tick) > 0 else np.zeros(0, dtype=np.int32)
+        self.times = self.ticks['time']
+        self.num_ticks = len(self.times)
+        self._chunk = None
+        self._chunk_index = None
+
+    def __len__(self):
+        return self.num_ticks
+
+    def get_member(self, name):
+        '''
+        returns the array of a member, memory-mapped if it is stored uncompressed and mmap is on
+        '''
+        if name in self.offsets:
+            return map_member(self.file_name, self.offsets[name])
+        if self.archive is None:
+            self.archive = np.load(self.file_name)
+        return self.archive[name]
+
+    def load_chunk(self, chunk):
+        if chunk != self._chunk_index:
+            self._chunk = {'agents': {column: self.get_member('agents_{}_{:06d}'.format(column, chunk))
+                                for column in agent_columns},
+                           'collisions': {column: self.get_member('collisions_{}_{:06d}'.format(column, chunk))
+                                for column in collision_columns}}
+            self._chunk_index = chunk
+        return self._chunk
+
+    def seek(self, time):
+        '''
+        returns the index of the last tick at or before time, 0 if time is before the first tick
+        '''
+        return max(int(np.searchsorted(self.times, time, side = 'right')) - 1, 0)
+
+    def get_light_state(self, index):
+        return (self.metadata['light_colors'][self.ticks['horizontal_light'][index]],
+                self.metadata['light_colors'][self.ticks['vertical_light'][index]])
+
+    def get_columns(self, index):
+        '''
+        returns the agent columns of a tick as a dictionary of arrays
+        '''
+        chunk = self.load_chunk(self.chunk_of_tick[index])
+        start = self.ticks['agent_start'][index]
+        end = start + self.ticks['num_agents'][index]
+        return {column: values[start:end] for column, values in chunk['agents'].items()}
+
+    def get_collisions(self, index):
+        '''
+        returns the list of (agent id, agent id) pairs that collided at a tick
+        '''
+        chunk = self.load_chunk(self.chunk_of_tick[index])
+        start = self.ticks['collision_start'][index]
+        end = start + self.ticks['num_collisions'][index]
+        return list(zip(chunk['collisions']['agent_id_1'][start:end].tolist(),
+            chunk['collisions']['agent_id_2'][start:end].tolist()))
+
+    def get_tick(self, index):
+        '''
+        returns a tick with its time, light state, collisions and the lists of its cars and pedestrians, every agent
+        has an agent_id, a state, a prim_id and a prim_progress and either a color or a pedestrian_type and a film_dim
+        '''
+        cars, pedestrians = self.get_agents(self.get_columns(index))
+        return SimpleNamespace(index = index, time = float(self.times[index]),
+                frame_idx = int(self.ticks['frame_idx'][index]), light_state = self.get_light_state(index),
+                cars = cars, pedestrians = pedestrians, collisions = self.get_collisions(index))
+
+    def get_agents(self, columns):
+        '''
+        turns agent columns into lists of cars and pedestrians
+        '''
+        cars = []
+        pedestrians = []
+        for row in range(len(columns['agent_id'])):
+            agent = SimpleNamespace(agent_id = int(columns['agent_id'][row]), state = columns['state'][row],
+                    prim_id = int(columns['prim_id'][row]), prim_progress = float(columns['prim_progress'][row]))
+            if columns['kind'][row] == CAR:
+                agent.color = self.metadata['car_colors'][columns['sprite'][row]]
+                cars.append(agent)
+            else:
+                agent.pedestrian_type = self.metadata['pedestrian_types'][columns['sprite'][row]]
+                agent.film_dim = (1, 6)
+                pedestrians.append(agent)
+        return cars, pedestrians
+
+    def get_tick_at(self, time):
+        return self.get_tick(self.seek(time))
+
+    def __iter__(self):
+        for index in range(self.num_ticks):
+            yield self.get_tick(index)
+
+    def close(self):
+        self._chunk = None
+        self._chunk_index = None
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    import prepare.primitive_graph as primitive_graph
+    from simulation.simulator import Simulator
+    parser = argparse.ArgumentParser(description='Record a headless simulation')
+    parser.add_argument('--duration', type=float, default=60., help='simulated seconds')
+    parser.add_argument('--dt', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--spawn-probability', type=float, default=1.)
+    parser.add_argument('--output', default='simulation.npz')
+    args = parser.parse_args()
+    simulator = Simulator(primitive_graph.build_primitive_graph(), dt = args.dt, seed = args.seed,
+            spawn_probability = args.spawn_probability)
+    start_time = time.time()
+    ticks = record_simulation(simulator, args.output, int(round(args.duration / args.dt)))
+    print('recorded {} ticks to {} in {:.1f} s'.format(ticks, args.output, time.time() - start_time))
@@ -0,0 +1,396 @@
+# Headless Simulator
+
+import string
+import numpy as np
+import components.planner as planner
+import components.car as car
+import components.aux.honk_wavefront as wavefront
+import components.traffic_signals as traffic_signals
+from components.crowd import Crowd
+from components.social_force import CellList
+from components.pedestrian import Pedestrian
+import prepare.queue as queue
+import assumes.params as params
+from prepare.graph import FrozenGraph
+from prepare.collision_check import collision_free, get_bounding_circles
+from prepare.pedestrian_routes import get_route_table
+from simulation.random_streams import RandomStreams
+
+def path_to_primitives(path):
+    '''
+    converts a path on the primitive graph into the list of IDs of the primitives traversed by the path
+    '''
+    primitives = []
+    for node_s, node_e in zip(path[:-1], path[1:]):
+        next_prim_id = planner.edge_to_prim_id[(node_s, node_e)]
+        primitives.append(next_prim_id)
+    return primitives
+
+class Simulator():
+    '''
+    Simulator Class
+
+    Holds the complete state of the intersection (cars, pedestrians, traffic lights, reservations, honk wavefronts)
+    and advances it with step(dt). Nothing is drawn here; visualization, logging etc. are attached as observers,
+    i.e., callables that are called as observer(simulator) after every step. All randomness comes from the streams
+    derived from seed, so two simulators with the same seed and parameters produce identical runs.
+
+    '''
+    def __init__(self, primitive_graph, traffic_lights=None, dt=0.1,
+                 spawn_probability=1, # probability that a new car requests to enter at each step
+                 honk_probability=0.005, # probability that a car starts honking at each step
+                 unhonk_probability=0.4, # probability that a honking car stops honking at each step
+                 patience=0, # how long (in seconds) a rejected request keeps being retried
+                 bounds=(1062, 762), # size of the intersection
+                 seed=None, # simulation seed, a random seed is drawn if None
+                 spawn_sources=None, # source nodes where spawned cars enter, all sources if None
+                 coarse_steps=1, # cars far from conflicts are integrated only every coarse_steps steps
+                 conflict_margin=100, # cars closer than this to params.conflict_zone are integrated every step
+                 agent_margin=150, # cars closer than this to another agent are integrated every step
+                 social_force=None, # components.social_force.SocialForce that keeps pedestrians apart, off if None
+                 ignore_pedestrian_pairs=False): # leave touching pedestrians out of collisions, see check_collisions
+        self.streams = RandomStreams(seed)
+        self.seed = self.streams.seed
+        if isinstance(primitive_graph, FrozenGraph):
+            self.primitive_graph = primitive_graph
+        else:
+            self.primitive_graph = primitive_graph.freeze()
+        if traffic_lights is None:
+            traffic_lights = traffic_signals.TrafficLights(3, 23, random_start = False, rng = self.streams.lights)
+        self.traffic_lights = traffic_lights
+        if spawn_sources is None:
+            self.spawn_sources = self.primitive_graph.sources
+        else:
+            self.spawn_sources = [self.primitive_graph.index(node) for node in spawn_sources]
+        self.dt = dt
+        self.spawn_probability = spawn_probability
+        self.honk_probability = honk_probability
+        self.unhonk_probability = unhonk_probability
+        self.patience = patience
+        self.bounds = bounds
+        self.coarse_steps = coarse_steps
+        self.conflict_margin = conflict_margin
+        self.agent_margin = agent_margin
+        self.social_force = social_force
+        self.ignore_pedestrian_pairs = ignore_pedestrian_pairs
+        self._pending_dt = dict() # license plate -> steps a coarse car has not been integrated for yet
+        self.time = 0
+        self.frame_idx = 0
+        self.cars = dict() # license plate -> car
+        self.destinations = dict() # license plate -> sink node of the car
+        self.exited = [] # (license plate, sink node, car) of the cars that finished their path during the last step
+        self.crowd = Crowd() # all pedestrians are advanced together
+        self.pedestrians = self.crowd.members
+        self.wavefronts = set()
+        self.edge_time_stamps = dict()
+        self.request_queue = queue.Queue()
+        self.collisions = [] # pairs of agents colliding during the last step
+        self.observers = []
+        self.metrics = {'requests': 0, # number of cars that asked to enter
+                        'admitted': 0, # number of cars that got a safe path
+                        'rejections': 0, # number of unsafe planning attempts
+                        'dropped': 0, # number of requests that ran out of patience
+                        'unroutable': 0, # number of requests without a path to their sink
+                        'collisions': 0, # number of colliding pairs in self.collisions summed over all steps
+                        'pedestrian_collisions': 0, # number of colliding pairs of two pedestrians summed over all steps
+                        'total_delay': 0., # time admitted cars spent waiting in the request queue
+                        'deferred_car_steps': 0} # car steps merged into coarse steps
+        self._next_agent_id = 0
+        self._next_spawn_frame = self.draw_spawn_gap() - 1
+
+    def draw_spawn_gap(self):
+        '''
+        returns the number of steps until the next car is spawned, spawning with spawn_probability at every step is
+        the same as drawing geometrically distributed gaps, which lets the next spawn be known in advance
+        '''
+        if self.spawn_probability <= 0:
+            return float('inf')
+        return int(self.streams.spawner.geometric(min(self.spawn_probability, 1)))
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def _new_agent_id(self):
+        agent_id = self._next_agent_id
+        self._next_agent_id += 1
+        return agent_id
+
+    def generate_license_plate(self):
+        choices = string.digits + string.ascii_uppercase
+        while True:
+            plate_number = ''.join(choices[k] for k in self.streams.spawner.integers(len(choices), size=7))
+            if plate_number not in self.cars:
+                return plate_number
+
+    def new_agent_rng(self):
+        return self.streams.agent()
+
+    def add_pedestrian(self, person):
+        person.agent_id = self._new_agent_id()
+        self.crowd.add(person)
+
+    def spawn_pedestrian(self, origin, destination, pedestrian_type='3', route_table=None):
+        '''
+        adds a pedestrian at origin that walks the precomputed route to destination, route_table is the shared table
+        of prepare.pedestrian_routes if None
+        '''
+        if route_table is None:
+            route_table = get_route_table()
+        person = Pedestrian(init_state = route_table.get_initial_state(origin, destination),
+                prim_queue = route_table.get_queue(origin, destination), pedestrian_type = pedestrian_type)
+        self.add_pedestrian(person)
+        return person
+
+    def add_car(self, the_car, plate_number=None):
+        '''
+        adds a car that already has its primitives, bypassing the planner
+        '''
+        if plate_number is None or plate_number in self.cars:
+            plate_number = self.generate_license_plate()
+        the_car.agent_id = self._new_agent_id()
+        if the_car.rng is None:
+            the_car.rng = self.new_agent_rng()
+        self.cars[plate_number] = the_car
+        return plate_number
+
+    def request_car(self, start_node, end_node, color='blue', plate_number=None, patience=None):
+        '''
+        queues a request for a car to drive from start_node to end_node on the primitive graph, the car is admitted
+        once the planner finds a path that does not conflict with the current reservations, unsafe requests are
+        retried for patience seconds (self.patience if None)
+        '''
+        if plate_number is None:
+            plate_number = self.generate_license_plate()
+        if patience is None:
+            patience = self.patience
+        self.request_queue.enqueue((plate_number, start_node, end_node, color, self.time, patience))
+        self.metrics['requests'] += 1
+        return plate_number
+
+    def spawn_car(self):
+        '''
+        requests a car with random color from a random source to a random sink
+        '''
+        spawner = self.streams.spawner
+        start_node = self.primitive_graph.node(spawner.choice(self.spawn_sources))
+        end_node = self.primitive_graph.node(spawner.choice(self.primitive_graph.sinks))
+        color = ['gray', 'blue'][spawner.integers(2)]
+        return self.request_car(start_node, end_node, color=color)
+
+    def process_requests(self):
+        '''
+        tries to admit every queued request in order, requests that are not safe are kept for patience seconds
+        '''
+        remaining = []
+        while self.request_queue.len() > 0:
+            request = self.request_queue.pop()
+            plate_number, start_node, end_node, color, request_time, patience = request
+            _, shortest_path = planner.dijkstra(start_node, end_node, self.primitive_graph)
+            if len(shortest_path) < 2:
+                self.metrics['unroutable'] += 1
+            elif planner.is_safe(path = shortest_path, current_time = self.time, primitive_graph = self.primitive_graph, edge_time_stamps = self.edge_time_stamps):
+                planner.time_stamp_edge(path = shortest_path, edge_time_stamps = self.edge_time_stamps, current_time = self.time, primitive_graph = self.primitive_graph)
+                the_car = car.KinematicCar(init_state=start_node, color=color, rng=self.new_agent_rng())
+                for prim_id in path_to_primitives(path=shortest_path):
+                    the_car.prim_queue.enqueue((prim_id, 0))
+                plate_number = self.add_car(the_car, plate_number)
+                self.destinations[plate_number] = end_node
+                self.metrics['admitted'] += 1
+                self.metrics['total_delay'] += self.time - request_time
+            else:
+                self.metrics['rejections'] += 1
+                if self.time - request_time < patience:
+                    remaining.append(request)
+                else:
+                    self.metrics['dropped'] += 1
+        for request in remaining:
+            self.request_queue.enqueue(request)
+
+    def in_bounds(self, x, y):
+        return 0 <= x <= self.bounds[0] and 0 <= y <= self.bounds[1]
+
+    def update_pedestrians(self, dt):
+        positions = self.crowd.get_positions()
+        out_of_bounds = np.any((positions < 0) | (positions > np.array(self.bounds)), axis=1)
+        if out_of_bounds.any():
+            self.crowd.remove(out_of_bounds)
+        self.crowd.prim_next(dt, self.get_pedestrian_corrections())
+
+    def get_pedestrian_corrections(self):
+        '''
+        returns the velocity corrections of the social force model for all pedestrians, None if it is off
+        '''
+        if self.social_force is None:
+            return None
+        return self.social_force.get_corrections(self.crowd.states[0:len(self.crowd)])
+
+    def get_fine_cars(self, dt):
+        '''
+        returns the set of license plates of the cars that have to be integrated at this step when multi-rate
+        stepping is on: cars near the conflict zone, cars near other agents and cars whose primitive ends before the
+        next synchronization
+        '''
+        x_min, y_min, x_max, y_max = params.conflict_zone
+        plates = list(self.cars)
+        car_positions = np.array([self.cars[plate_number].state[2:4] for plate_number in plates], dtype=float).reshape(-1, 2)
+        positions = np.vstack([car_positions] + [np.array(person.state[0:2], dtype=float).reshape(1, 2) for person in self.pedestrians])
+        # distance to the conflict zone rectangle
+        dx = np.maximum(np.maximum(x_min - car_positions[:, 0], car_positions[:, 0] - x_max), 0)
+        dy = np.maximum(np.maximum(y_min - car_positions[:, 1], car_positions[:, 1] - y_max), 0)
+        near_zone = np.hypot(dx, dy) <= self.conflict_margin
+        # distance to the closest other agent
+        distances = np.hypot(car_positions[:, None, 0] - positions[None, :, 0], car_positions[:, None, 1] - positions[None, :, 1])
+        distances[np.arange(len(plates)), np.arange(len(plates))] = np.inf
+        near_agent = np.min(distances, axis=1, initial=np.inf) <= self.agent_margin
+        window = self.coarse_steps * dt
+        return {plate_number for k, plate_number in enumerate(plates) if near_zone[k] or near_agent[k] or
+                self.cars[plate_number].get_time_to_primitive_end() < window}
+
+    def synchronize(self):
+        '''
+        integrates all cars that have pending time from multi-rate stepping
+        '''
+        for plate_number in self.cars:
+            pending_dt = self._pending_dt.pop(plate_number, [])
+            if len(pending_dt) > 0:
+                self.cars[plate_number].prim_next_steps(pending_dt)
+
+    def update_cars(self, dt):
+        cars_to_remove = []
+        multi_rate = self.coarse_steps > 1
+        if multi_rate:
+            is_sync_step = (self.frame_idx + 1) % self.coarse_steps == 0
+            fine_cars = set() if is_sync_step else self.get_fine_cars(dt)
+        for plate_number in self.cars:
+            the_car = self.cars[plate_number]
+            if the_car.prim_queue.len() > 0:
+                if not multi_rate:
+                    the_car.prim_next(dt)
+                elif is_sync_step or plate_number in fine_cars:
+                    # the deferred steps are replayed with their own disturbances and controller parameters
+                    the_car.prim_next_steps(self._pending_dt.pop(plate_number, []) + [dt])
+                else:
+                    self._pending_dt.setdefault(plate_number, []).append(dt)
+                    self.metrics['deferred_car_steps'] += 1
+            else:
+                cars_to_remove.append(plate_number)
+        self.exited = []
+        for plate_number in cars_to_remove:
+            self.exited.append((plate_number, self.destinations.pop(plate_number, None), self.cars[plate_number]))
+            self._pending_dt.pop(plate_number, None)
+            del self.cars[plate_number]
+
+    def update_honking(self, dt):
+        for wave in list(self.wavefronts):
+            wave.next(dt)
+            if wave.get_data()[3] < wavefront.min_intensity:
+                self.wavefronts.remove(wave)
+        for the_car in self.cars.values():
+            if not the_car.is_honking and self.streams.honking.random() <= self.honk_probability:
+                the_car.toggle_honk()
+                # offset is 600 before scaling
+                wave = wavefront.HonkWavefront([the_car.state[2] + 600*params.car_scale_factor*np.cos(the_car.state[1]), the_car.state[3] + 600*params.car_scale_factor*np.sin(the_car.state[1]), 0, 0], init_energy=100000)
+                self.wavefronts.add(wave)
+            elif the_car.is_honking and self.streams.honking.random() <= self.unhonk_probability:
+                the_car.toggle_honk()
+
+    def check_collisions(self):
+        '''
+        finds the colliding pairs of agents. A cell list finds the pairs whose bounding circles overlap and only those
+        get the exact test. Colliding pairs of two pedestrians are also counted in metrics['pedestrian_collisions'];
+        with ignore_pedestrian_pairs they are left out of self.collisions and metrics['collisions'], since pedestrians
+        walking in a crowd may touch
+        '''
+        cars = list(self.cars.values())
+        agents = cars + self.pedestrians
+        self.collisions = []
+        if len(agents) < 2:
+            return
+        car_centers, car_radius = get_bounding_circles([the_car.state for the_car in cars], is_car = True)
+        pedestrian_centers, pedestrian_radius = get_bounding_circles(self.crowd.states[0:len(self.crowd)],
+                is_car = False)
+        centers = np.vstack([car_centers, pedestrian_centers])
+        radii = np.r_[np.full(len(cars), car_radius), np.full(len(self.pedestrians), pedestrian_radius)]
+        cutoff = 2 * max(car_radius, pedestrian_radius)
+        i, j = CellList(cutoff, (0, 0) + tuple(self.bounds)).get_pairs(centers, cutoff)
+        i, j = np.minimum(i, j), np.maximum(i, j)
+        candidates = np.hypot(*(centers[i] - centers[j]).T) <= radii[i] + radii[j]
+        i, j = i[candidates], j[candidates]
+        for k in np.lexsort((j, i)): # in the order of a double loop over the agents
+            agent_1, agent_2 = agents[i[k]], agents[j[k]]
+            if not collision_free(agent_1, agent_2)[0]:
+                if i[k] >= len(cars): # both are pedestrians, i < j
+                    self.metrics['pedestrian_collisions'] += 1
+                    if self.ignore_pedestrian_pairs:
+                        continue
+                self.collisions.append((agent_1, agent_2))
+        self.metrics['collisions'] += len(self.collisions)
+
+    def step(self, dt=None):
+        '''
+        advances the simulation by dt (by default self.dt) and notifies the observers
+        '''
+        if dt is None:
+            dt = self.dt
+        if self.frame_idx >= self._next_spawn_frame:
+            self.spawn_car()
+            self._next_spawn_frame = self.frame_idx + self.draw_spawn_gap()
+        self.process_requests()
+        self.traffic_lights.update(dt)
+        self.update_pedestrians(dt)
+        self.update_cars(dt)
+        self.update_honking(dt)
+        self.check_collisions()
+        self.time += dt
+        self.frame_idx += 1
+        for observer in self.observers:
+            observer(self)
+
+    def run(self, num_steps, dt=None):
+        for _ in range(num_steps):
+            self.step(dt)
+
+    def is_quiescent(self):
+        '''
+        returns True if nothing but the traffic lights and waiting pedestrians changes until the next event, i.e.,
+        there are no cars, no pending requests, no honk wavefronts, no walking pedestrians and no pedestrians pushed
+        apart by the social force model
+        '''
+        if len(self.cars) > 0 or self.request_queue.len() > 0 or len(self.wavefronts) > 0 or \
+                self.crowd.is_walking().any():
+            return False
+        corrections = self.get_pedestrian_corrections()
+        return corrections is None or not corrections[self.crowd.active[0:len(self.crowd)]].any()
+
+    def get_next_event_time(self, dt=None):
+        '''
+        returns the earliest time at which a car spawns, a light changes, a car finishes its current primitive or a
+        pedestrian reaches its next waypoint
+        '''
+        if dt is None:
+            dt = self.dt
+        event_times = [self.time + (self._next_spawn_frame - self.frame_idx) * dt,
+                       self.time + self.traffic_lights.get_time_to_change()]
+        event_times += [self.time + the_car.get_time_to_primitive_end() for the_car in self.cars.values()]
+        event_times += [self.time + float(np.min(self.crowd.get_time_to_primitive_end(), initial=np.inf))]
+        return min(event_times)
+
+    def idle(self, num_steps, dt=None):
+        '''
+        advances a quiescent simulation by num_steps steps at once, this gives the same result as calling step
+        num_steps times as long as no event happens in between (see get_next_event_time); observers are not called
+        '''
+        if dt is None:
+            dt = self.dt
+        if num_steps <= 0:
+            return
+        duration = num_steps * dt
+        self.traffic_lights.update(duration)
+        self.crowd.prim_next(duration)
+        self.time += duration
+        self.frame_idx += num_steps
+        self.collisions = []
+        self.exited = []
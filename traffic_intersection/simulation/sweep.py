@@ -0,0 +1,163 @@
+# Parameter Sweeps
+#
+# run from the traffic_intersection folder, e.g.
+#     python -m simulation.sweep --spawn-probability 0.1 0.5 1 --green-max 15 23 --seeds 0 1 2 --output sweep.jsonl
+# rerunning the same command resumes the sweep, runs already in the output file are skipped, add --retry-failed to run
+# the runs that raised an error again
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import components.traffic_signals as traffic_signals
+import prepare.primitive_graph as primitive_graph
+from simulation.simulator import Simulator
+
+default_config = {'spawn_probability': 1, 'yellow_max': 3, 'green_max': 23, 'dt': 0.1, 'patience': 0, 'duration': 60}
+
+# read-only primitive graph of a worker process, set once by init_worker
+_primitive_graph = None
+
+def init_worker(frozen_graph):
+    global _primitive_graph
+    _primitive_graph = frozen_graph
+
+def expand_grid(grid, seeds):
+    '''
+    turns a dictionary of parameter lists into the list of all run configurations, one per combination and seed
+    input:  grid - dictionary mapping parameter names (see default_config) to lists of values
+            seeds - list of simulation seeds
+    output: list of configuration dictionaries
+    '''
+    names = sorted(grid)
+    configs = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        for seed in seeds:
+            config = dict(default_config)
+            config.update(zip(names, values))
+            config['seed'] = seed
+            configs.append(config)
+    return configs
+
+def run_key(config):
+    '''
+    returns a key that identifies a run by its configuration, numbers are compared as floats so that e.g. a duration
+    of 60 and of 60.0 give the same key
+    '''
+    normalized = {name: float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+            for name, value in config.items()}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+def run_simulation(config, frozen_graph=None):
+    '''
+    runs one headless simulation and returns its metrics
+    '''
+    if frozen_graph is None:
+        frozen_graph = _primitive_graph
+    traffic_lights = traffic_signals.TrafficLights(config['yellow_max'], config['green_max'], random_start = False,
+            horizontal_state = ['red', 0])
+    simulator = Simulator(frozen_graph, traffic_lights = traffic_lights, dt = config['dt'],
+            spawn_probability = config['spawn_probability'], patience = config['patience'], seed = config['seed'])
+    start_time = time.time()
+    simulator.run(int(round(config['duration'] / config['dt'])))
+    metrics = dict(simulator.metrics)
+    metrics['mean_delay'] = metrics['total_delay'] / metrics['admitted'] if metrics['admitted'] > 0 else 0.
+    metrics['wall_time'] = time.time() - start_time
+    return metrics
+
+def load_results(file_name):
+    '''
+    returns the results already stored in file_name, keyed by run key, a later line replaces an earlier one of the same
+    run so that a retried run replaces its failure
+    '''
+    results = dict()
+    if os.path.exists(file_name):
+        with open(file_name) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError: # the last line may be cut short if a sweep was interrupted
+                    continue
+                # the key is recomputed so that files written with an older run_key still resume
+                results[run_key(result['config'])] = result
+    return results
+
+def repair_results(file_name):
+    '''
+    makes file_name end with a complete line before results are appended to it: a last line that was cut short by an
+    interrupted sweep is removed, a complete last line without its newline gets one
+    '''
+    if not os.path.exists(file_name):
+        return
+    with open(file_name, 'rb+') as f:
+        content = f.read()
+        if len(content) == 0 or content.endswith(b'\n'):
+            return
+        start = content.rfind(b'\n') + 1
+        try:
+            json.loads(content[start:].decode())
+            f.write(b'\n')
+        except ValueError:
+            f.truncate(start)
+
+def is_failed(result):
+    return 'error' in result
+
+def run_sweep(grid, seeds, file_name, max_workers=None, frozen_graph=None, retry_failed=False):
+    '''
+    runs all configurations of the grid in a process pool and appends one JSON line per finished run to file_name,
+    runs that are already in file_name are skipped so that an interrupted sweep can be resumed. A run that raises an
+    error does not stop the others, it is stored as a line with the traceback under 'error' instead of 'metrics' and
+    is skipped on resume unless retry_failed is True
+    output: dictionary of all results keyed by run key
+    '''
+    if frozen_graph is None:
+        frozen_graph = primitive_graph.build_primitive_graph().freeze()
+    results = load_results(file_name)
+    def is_done(config):
+        key = run_key(config)
+        return key in results and not (retry_failed and is_failed(results[key]))
+    pending = [config for config in expand_grid(grid, seeds) if not is_done(config)]
+    if len(pending) == 0:
+        return results
+    repair_results(file_name)
+    with open(file_name, 'a') as f, ProcessPoolExecutor(max_workers = max_workers, initializer = init_worker,
+            initargs = (frozen_graph,)) as executor:
+        futures = {executor.submit(run_simulation, config): config for config in pending}
+        for finished, future in enumerate(as_completed(futures)):
+            config = futures[future]
+            result = {'key': run_key(config), 'config': config}
+            try:
+                result['metrics'] = future.result()
+            except Exception:
+                result['error'] = traceback.format_exc()
+            results[result['key']] = result
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            print('{} {} of {} runs: {}'.format('failed' if is_failed(result) else 'finished', finished + 1,
+                    len(pending), config))
+    num_failed = sum(is_failed(result) for result in results.values())
+    if num_failed > 0:
+        print('{} runs failed, see the error entries in {}'.format(num_failed, file_name))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run headless simulations over a parameter grid')
+    parser.add_argument('--spawn-probability', type=float, nargs='+', default=[default_config['spawn_probability']])
+    parser.add_argument('--yellow-max', type=float, nargs='+', default=[default_config['yellow_max']])
+    parser.add_argument('--green-max', type=float, nargs='+', default=[default_config['green_max']])
+    parser.add_argument('--dt', type=float, nargs='+', default=[default_config['dt']])
+    parser.add_argument('--patience', type=float, nargs='+', default=[default_config['patience']])
+    parser.add_argument('--duration', type=float, nargs='+', default=[default_config['duration']], help='simulated seconds')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--output', default='sweep.jsonl', help='JSON lines file for the results')
+    parser.add_argument('--retry-failed', action='store_true', help='run the failed runs of the output file again')
+    args = parser.parse_args()
+    grid = {'spawn_probability': args.spawn_probability, 'yellow_max': args.yellow_max, 'green_max': args.green_max,
+            'dt': args.dt, 'patience': args.patience, 'duration': args.duration}
+    run_sweep(grid, args.seeds, args.output, max_workers = args.workers, retry_failed = args.retry_failed)